@@ -0,0 +1,129 @@
+#!/usr/bin/env python3
+"""Benchmark the fetch pipeline end to end against a local replay server.
+
+    python benchmarks/bench_fetch.py --synthetic 5000 --latency 0.05 --rate-limit 60 --window 5
+    python benchmarks/bench_fetch.py --cassette cassettes/2024.json --year 2024
+
+Cassettes are recorded from the live APIs with HTTP_RECORD=<file>, or
+generated with --synthetic N. No request leaves the machine: the fetchers
+are pointed at the replay server through their URL overrides, and caches
+and stores go to a temporary directory.
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import platform
+import tempfile
+import logging
+from datetime import datetime
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+BASE_DIR = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, BASE_DIR)
+sys.path.insert(0, BENCH_DIR)
+
+import http_replay
+import synthetic
+
+logger = logging.getLogger(__name__)
+
+YEAR = 2024
+USERNAME = 'benchmark'
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Benchmark fetching against recorded responses')
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument('--cassette', help='Cassette recorded with HTTP_RECORD=<file>')
+    source.add_argument('--synthetic', type=int, metavar='N', help='Generate a cassette with N records')
+    parser.add_argument('--year', type=int, default=YEAR)
+    parser.add_argument('--username', default=os.getenv('DISCOGS_USERNAME', USERNAME),
+                      help='Discogs username the cassette was recorded for')
+    parser.add_argument('--latency', type=float, default=0.0, help='Seconds added to every response')
+    parser.add_argument('--jitter', type=float, default=0.0)
+    parser.add_argument('--rate-limit', type=int, help='Requests per window the server allows')
+    parser.add_argument('--window', type=float, default=60.0)
+    parser.add_argument('--error-rate', type=float, default=0.0, help='Fraction of requests answered with 429')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', help='Write results as JSON to this file')
+    return parser.parse_args()
+
+def timed(name, func, server, limiters, results):
+    """Run one stage and record its time, server traffic and limiter waits"""
+    requests_before = server.stats.copy()
+    sleep_before = sum(limiter.sleep_time for limiter in limiters)
+    start = time.perf_counter()
+    try:
+        func()
+        error = None
+    except Exception as e:
+        error = str(e)
+    elapsed = time.perf_counter() - start
+    traffic = server.stats.copy()
+    traffic.subtract(requests_before)
+    results[name] = {
+        'seconds': elapsed,
+        'limiter_sleep': sum(limiter.sleep_time for limiter in limiters) - sleep_before,
+        'server': {key: value for key, value in traffic.items() if value},
+        'error': error
+    }
+    logger.info(f"{name:<15} {elapsed:8.2f}s  {dict(results[name]['server'])}"
+                f"{'  failed: ' + error if error else ''}")
+
+def main():
+    args = parse_args()
+    logging.basicConfig(level=logging.INFO)
+    work_dir = tempfile.mkdtemp(prefix='bench-fetch-')
+    
+    cassette_file = args.cassette
+    if args.synthetic:
+        cassette_file = os.path.join(work_dir, 'synthetic.json')
+        synthetic.write_cassette(cassette_file, synthetic.make_collection(args.synthetic, args.year, args.seed),
+                                 args.username)
+    server = http_replay.ReplayServer(
+        http_replay.Cassette(cassette_file), latency=args.latency, jitter=args.jitter,
+        rate_limit=args.rate_limit, window=args.window, error_rate=args.error_rate, seed=args.seed
+    ).start()
+    
+    # The fetch modules read their configuration at import time
+    os.environ.update(server.env())
+    os.environ['VINYL_CACHE_DIR'] = os.path.join(work_dir, 'cache')
+    os.environ['DISCOGS_USERNAME'] = args.username
+    os.environ.setdefault('DISCOGS_TOKEN', 'replay')
+    os.environ.setdefault('LASTFM_API_KEY', 'replay')
+    os.environ.setdefault('LASTFM_USERNAME', args.username)
+    import fetch_collection
+    import fetch_lastfm
+    limiters = [fetch_collection.rate_limiter, fetch_lastfm.rate_limiter]
+    
+    results = {}
+    timed('russ_fm', lambda: fetch_collection.load_image_lookup(max_age=0), server, limiters, results)
+    timed('year_fetch', lambda: fetch_collection.fetch_collection(args.year), server, limiters, results)
+    timed('full_sync', lambda: fetch_collection.sync_store(full_sync=True), server, limiters, results)
+    timed('incremental', lambda: fetch_collection.sync_store(), server, limiters, results)
+    if any(key.startswith('GET ws.audioscrobbler.com') for key in server.cassette.interactions):
+        timed('lastfm', lambda: fetch_lastfm.fetch_lastfm_data(args.year), server, limiters, results)
+    server.shutdown()
+    
+    report = {
+        'meta': {
+            'timestamp': datetime.now().isoformat(),
+            'python': platform.python_version(),
+            'cassette': os.path.basename(cassette_file),
+            'latency': args.latency,
+            'jitter': args.jitter,
+            'rate_limit': args.rate_limit,
+            'window': args.window,
+            'error_rate': args.error_rate,
+            'seed': args.seed
+        },
+        'results': results
+    }
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+        logger.info(f"Results written to {args.output}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,112 @@
+#!/usr/bin/env python3
+"""Measure cold import time of the build entry points.
+
+    python benchmarks/bench_imports.py
+    python benchmarks/bench_imports.py --check   # fail if an offline build loads network clients
+
+Each import runs in a fresh interpreter, so nothing is shared between
+runs. --check also builds a synthetic year with --offline in a scratch
+copy of the project, and fails when importing generate_wrap or running
+that build pulls in a network client or python-dotenv, which would slow
+down every cached re-render.
+"""
+import os
+import sys
+import json
+import shutil
+import argparse
+import tempfile
+import statistics
+import subprocess
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+BASE_DIR = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, BASE_DIR)
+import synthetic
+
+MODULES = ['generate_wrap', 'generate_report', 'fetch_collection', 'fetch_lastfm']
+# Modules a render from local files should never need
+NETWORK_MODULES = ['requests', 'urllib3', 'discogs_client', 'dotenv', 'numpy']
+
+PROBE = '''
+import sys, time, json
+start = time.perf_counter()
+import {module}
+elapsed = time.perf_counter() - start
+print(json.dumps({{'seconds': elapsed, 'loaded': [name for name in {network!r} if name in sys.modules]}}))
+'''
+
+OFFLINE_YEAR = 2024
+OFFLINE_ARGS = ['--year', str(OFFLINE_YEAR), '--offline', '--lastfm', '--local-images', '--jobs', '1']
+RUN_PROBE = '''
+import sys, json
+import generate_wrap
+generate_wrap.main(generate_wrap.build_parser().parse_args({args!r}))
+print(json.dumps({{'loaded': [name for name in {network!r} if name in sys.modules]}}))
+'''
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Benchmark module import times')
+    parser.add_argument('--repeat', type=int, default=5, help='Fresh interpreters per module')
+    parser.add_argument('--output', help='Write results as JSON to this file')
+    parser.add_argument('--check', action='store_true',
+                      help='Exit with an error if an offline build imports a network client')
+    return parser.parse_args()
+
+def time_import(module, repeat):
+    timings = []
+    loaded = []
+    for _ in range(repeat):
+        result = subprocess.run(
+            [sys.executable, '-c', PROBE.format(module=module, network=NETWORK_MODULES)],
+            cwd=BASE_DIR, capture_output=True, text=True, check=True
+        )
+        probe = json.loads(result.stdout.strip().splitlines()[-1])
+        timings.append(probe['seconds'])
+        loaded = probe['loaded']
+    return {'best': min(timings), 'median': statistics.median(timings), 'network_modules': loaded}
+
+def offline_run_modules():
+    """Build a synthetic year offline in a scratch copy and return the network modules it loaded"""
+    with tempfile.TemporaryDirectory(prefix='bench-imports-') as work_dir:
+        for name in os.listdir(BASE_DIR):
+            if name.endswith('.py'):
+                shutil.copy(os.path.join(BASE_DIR, name), work_dir)
+        for name in ['templates', 'static']:
+            shutil.copytree(os.path.join(BASE_DIR, name), os.path.join(work_dir, name))
+        synthetic.write_fixture(work_dir, 200, OFFLINE_YEAR)
+        result = subprocess.run(
+            [sys.executable, '-c', RUN_PROBE.format(args=OFFLINE_ARGS, network=NETWORK_MODULES)],
+            cwd=work_dir, capture_output=True, text=True, check=True,
+            env=dict(os.environ, VINYL_CACHE_DIR=os.path.join(work_dir, '.cache'))
+        )
+        return json.loads(result.stdout.strip().splitlines()[-1])['loaded']
+
+def main():
+    args = parse_args()
+    results = {}
+    for module in MODULES:
+        results[module] = time_import(module, args.repeat)
+        print(f"{module:<20} best {results[module]['best'] * 1000:7.1f} ms  "
+              f"median {results[module]['median'] * 1000:7.1f} ms  "
+              f"loads {', '.join(results[module]['network_modules']) or '-'}")
+    
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+    
+    if args.check:
+        failed = False
+        if results['generate_wrap']['network_modules']:
+            print(f"generate_wrap imports {', '.join(results['generate_wrap']['network_modules'])} at startup")
+            failed = True
+        loaded = offline_run_modules()
+        print(f"offline build        loads {', '.join(loaded) or '-'}")
+        if loaded:
+            print(f"An offline build imports {', '.join(loaded)}")
+            failed = True
+        if failed:
+            sys.exit(1)
+
+if __name__ == "__main__":
+    main()
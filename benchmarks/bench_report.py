@@ -0,0 +1,185 @@
+#!/usr/bin/env python3
+"""Benchmark loading, analyzing and rendering reports on synthetic collections.
+
+    python benchmarks/bench_report.py --sizes 100,1000,10000 --output results.json
+    python benchmarks/bench_report.py --compare before.json after.json
+
+Each stage is timed on its own (best and median of --repeat runs), and peak
+memory is measured in a separate tracemalloc pass so it does not skew timings.
+"""
+import os
+import sys
+import gc
+import json
+import time
+import argparse
+import platform
+import statistics
+import subprocess
+import tempfile
+import tracemalloc
+import logging
+from datetime import datetime
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+BASE_DIR = os.path.dirname(BENCH_DIR)
+TEMPLATE_DIR = os.path.join(BASE_DIR, 'templates')
+sys.path.insert(0, BASE_DIR)
+sys.path.insert(0, BENCH_DIR)
+
+import synthetic
+import generate_report
+import collection_columns
+import collection_io
+
+logger = logging.getLogger(__name__)
+
+YEAR = 2024
+DEFAULT_SIZES = '100,1000,10000,100000'
+RENDER_LIMIT = 100000  # larger reports produce pages too big to be worth rendering
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Benchmark report analysis and rendering')
+    parser.add_argument('--sizes', default=DEFAULT_SIZES,
+                      help=f'Comma separated collection sizes (default {DEFAULT_SIZES}, up to 1000000)')
+    parser.add_argument('--repeat', type=int, default=3, help='Timed runs per stage')
+    parser.add_argument('--seed', type=int, default=0, help='Seed for the synthetic data')
+    parser.add_argument('--format', choices=sorted(collection_io.FORMATS), default='json',
+                      help='Collection file format to load')
+    parser.add_argument('--stream', action='store_true',
+                      help='Stream records from the file into the analysis instead of loading them first')
+    parser.add_argument('--columnar', action='store_true', help='Analyze with the NumPy columnar path')
+    parser.add_argument('--workers', type=int, default=1, help='Processes used by analyze_collection')
+    parser.add_argument('--render-limit', type=int, default=RENDER_LIMIT,
+                      help='Skip rendering for collections larger than this')
+    parser.add_argument('--output', help='Write results as JSON to this file')
+    parser.add_argument('--compare', nargs=2, metavar=('BASELINE', 'CURRENT'),
+                      help='Compare two result files instead of running')
+    return parser.parse_args()
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=BASE_DIR,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def measure(func, repeat):
+    """Time func over several runs, then measure its peak memory once"""
+    timings = []
+    result = None
+    for _ in range(repeat):
+        gc.collect()
+        start = time.perf_counter()
+        result = func()
+        timings.append(time.perf_counter() - start)
+    
+    gc.collect()
+    tracemalloc.start()
+    func()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, {
+        'best': min(timings),
+        'median': statistics.median(timings),
+        'peak_memory': peak
+    }
+
+def bench_size(size, args, work_dir):
+    """Benchmark each stage for one collection size"""
+    collection_file, lastfm_file = synthetic.write_fixture(work_dir, size, YEAR, args.seed, args.format)
+    with open(lastfm_file) as f:
+        lastfm_data = json.load(f)
+    
+    results = {}
+    collection, results['load'] = measure(lambda: generate_report.load_collection(collection_file), args.repeat)
+    
+    if args.columnar:
+        collection_columns.load_numpy()  # keep the one-off import out of the timings
+        columns, results['columnar_build'] = measure(
+            lambda: collection_columns.ColumnarCollection(collection), args.repeat)
+        data = columns
+    else:
+        data = collection
+    if args.stream:
+        # Load and analyze in one pass, as generate_report.main does
+        def stream_analyze():
+            records = collection_io.iter_collection(collection_file)
+            if args.columnar:
+                records = collection_columns.ColumnarCollection(records)
+            return generate_report.analyze_collection(records, YEAR, workers=args.workers)
+        stats, results['stream_analyze'] = measure(stream_analyze, args.repeat)
+    else:
+        stats, results['analyze'] = measure(
+            lambda: generate_report.analyze_collection(data, YEAR, workers=args.workers), args.repeat)
+    
+    if size <= args.render_limit:
+        html, results['render'] = measure(
+            lambda: generate_report.generate_html(stats, lastfm_data, TEMPLATE_DIR), args.repeat)
+        results['render']['output_bytes'] = len(html.encode('utf-8'))
+    else:
+        logger.info(f"Skipping render for {size} records (over --render-limit)")
+    
+    for stage, result in results.items():
+        logger.info(f"{size:>8} records  {stage:<15} best {result['best'] * 1000:10.1f} ms  "
+                    f"median {result['median'] * 1000:10.1f} ms  peak {result['peak_memory'] / 1e6:8.1f} MB")
+    return results
+
+def run(args):
+    sizes = [int(size) for size in args.sizes.split(',') if size.strip()]
+    report = {
+        'meta': {
+            'commit': git_commit(),
+            'timestamp': datetime.now().isoformat(),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'seed': args.seed,
+            'repeat': args.repeat,
+            'format': args.format,
+            'stream': args.stream,
+            'columnar': args.columnar,
+            'workers': args.workers
+        },
+        'results': {}
+    }
+    with tempfile.TemporaryDirectory() as work_dir:
+        for size in sizes:
+            report['results'][str(size)] = bench_size(size, args, work_dir)
+    
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+        logger.info(f"Results written to {args.output}")
+    return report
+
+def compare(baseline_file, current_file):
+    """Print the change in time and memory per size and stage between two runs"""
+    with open(baseline_file) as f:
+        baseline = json.load(f)
+    with open(current_file) as f:
+        current = json.load(f)
+    print(f"baseline {baseline['meta'].get('commit')}  vs  current {current['meta'].get('commit')}")
+    print(f"{'size':>8}  {'stage':<15} {'best (ms)':>21} {'change':>8} {'peak (MB)':>19} {'change':>8}")
+    for size, stages in current['results'].items():
+        for stage, result in stages.items():
+            before = baseline['results'].get(size, {}).get(stage)
+            if not before:
+                continue
+            time_change = result['best'] / before['best'] - 1 if before['best'] else 0
+            memory_change = result['peak_memory'] / before['peak_memory'] - 1 if before['peak_memory'] else 0
+            print(f"{size:>8}  {stage:<15} {before['best'] * 1000:10.1f}{result['best'] * 1000:11.1f} "
+                  f"{time_change:+8.1%} {before['peak_memory'] / 1e6:9.1f}{result['peak_memory'] / 1e6:10.1f} "
+                  f"{memory_change:+8.1%}")
+
+def main():
+    args = parse_args()
+    logging.basicConfig(level=logging.INFO)
+    # Keep the report modules quiet so only benchmark lines are printed
+    logging.getLogger('generate_report').setLevel(logging.WARNING)
+    if args.compare:
+        compare(*args.compare)
+    else:
+        run(args)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,159 @@
+"""Seeded synthetic collections and Last.fm summaries for benchmarking.
+
+Shapes follow what fetch_collection and fetch_lastfm write: a few artists
+own most records (Zipf-like), most records have one artist, a few are
+"Various", and records are spread unevenly over the year.
+"""
+import os
+import json
+import random
+from datetime import datetime, timedelta
+import collection_io
+import http_replay
+
+GENRES = ['Rock', 'Electronic', 'Jazz', 'Pop', 'Funk / Soul', 'Hip Hop', 'Folk, World, & Country',
+          'Classical', 'Reggae', 'Blues', 'Stage & Screen', 'Latin']
+STYLES = ['Indie Rock', 'Alternative Rock', 'Post-Punk', 'Synth-pop', 'Ambient', 'Techno', 'House',
+          'Shoegaze', 'Soul', 'Krautrock', 'Psychedelic Rock', 'Hard Bop', 'Dub', 'Experimental',
+          'New Wave', 'Prog Rock', 'Downtempo', 'Folk Rock', 'Soundtrack', 'Punk']
+FORMATS = [('Vinyl', ['LP', 'Album']), ('Vinyl', ['LP', 'Album', 'Reissue']), ('Vinyl', ['LP', 'Compilation']),
+           ('Vinyl', ['12"', '45 RPM', 'Single']), ('Vinyl', ['LP', 'Album', 'Limited Edition']),
+           ('Vinyl', ['2×LP', 'Album']), ('CD', ['Album'])]
+# Relative number of records added in each month
+MONTH_WEIGHTS = [6, 5, 6, 7, 7, 6, 6, 7, 8, 9, 12, 21]
+
+def zipf_weights(count, exponent=1.1):
+    """Cumulative Zipf weights, so a few items are picked far more often than the rest"""
+    cumulative = []
+    total = 0.0
+    for rank in range(1, count + 1):
+        total += 1.0 / rank ** exponent
+        cumulative.append(total)
+    return cumulative
+
+def make_collection(size, year=2024, seed=0):
+    """Generate `size` collection records added during `year`"""
+    rng = random.Random(seed)
+    artists = [f"Artist {i}" for i in range(max(10, size // 4))]
+    artist_weights = zipf_weights(len(artists))
+    labels = [f"Label {i}" for i in range(max(5, size // 20))]
+    label_weights = zipf_weights(len(labels))
+    months = list(range(1, 13))
+    
+    records = []
+    for i in range(size):
+        roll = rng.random()
+        if roll < 0.03:
+            record_artists = ['Various']
+        elif roll < 0.10:
+            record_artists = rng.choices(artists, cum_weights=artist_weights, k=2)
+        else:
+            record_artists = rng.choices(artists, cum_weights=artist_weights)
+        
+        month = rng.choices(months, weights=MONTH_WEIGHTS)[0]
+        start = datetime(year, month, 1)
+        end = datetime(year + 1, 1, 1) if month == 12 else datetime(year, month + 1, 1)
+        date_added = start + timedelta(seconds=rng.randrange(int((end - start).total_seconds())))
+        
+        format_name, descriptions = rng.choice(FORMATS)
+        release_id = 1000000 + i
+        matched = rng.random() < 0.95  # records with a russ.fm page
+        slug = record_artists[0].lower().replace(' ', '-')
+        records.append({
+            'id': release_id,
+            'instance_id': 500000000 + i,
+            'title': f"Album {i}",
+            'artist': record_artists,
+            'date_added': date_added.isoformat(),
+            'year': rng.randint(1960, year),
+            'formats': [{'name': format_name, 'qty': '1', 'text': '', 'descriptions': list(descriptions)}],
+            'labels': rng.choices(labels, cum_weights=label_weights, k=rng.choice([1, 1, 1, 2])),
+            'genres': rng.sample(GENRES, rng.choice([1, 1, 2, 3])),
+            'styles': rng.sample(STYLES, rng.choice([0, 1, 2, 2, 3])),
+            'cover_image': f"https://www.russ.fm/albums/{release_id}/{release_id}.jpg" if matched else None,
+            'artist_image': f"https://www.russ.fm/artists/{slug}/{slug}.jpg" if matched and rng.random() < 0.9 else None,
+            'album_uri': f"https://www.russ.fm/albums/{release_id}/" if matched else None,
+            'artist_uri': f"https://www.russ.fm/artists/{slug}/" if matched else None
+        })
+    records.sort(key=lambda record: record['date_added'])
+    return records
+
+def make_lastfm(collection, year=2024, seed=0, limit=10):
+    """Generate a Last.fm summary whose top artists and albums overlap the collection"""
+    rng = random.Random(seed + 1)
+    artist_counts = {}
+    for record in collection:
+        for artist in record['artist']:
+            artist_counts[artist] = artist_counts.get(artist, 0) + 1
+    top_artists = sorted(artist_counts, key=lambda artist: -artist_counts[artist])[:limit]
+    albums = rng.sample(collection, min(limit, len(collection)))
+    plays = sorted((rng.randint(50, 2000) for _ in range(limit)), reverse=True)
+    return {
+        'top_artists': [[artist, count] for artist, count in zip(top_artists, plays)],
+        'top_albums': [[f"{record['artist'][0]} - {record['title']}", count]
+                       for record, count in zip(albums, plays)],
+        'total_scrobbles': sum(plays) * 20,
+        'fetched_at': datetime(year, 12, 31).isoformat(),
+        'year': year
+    }
+
+def write_fixture(directory, size, year=2024, seed=0, fmt='json'):
+    """Write the year's collection (in the given collection_io format) and Last.fm files; returns their paths"""
+    os.makedirs(directory, exist_ok=True)
+    collection = make_collection(size, year, seed)
+    collection_file = collection_io.collection_path(directory, year, fmt)
+    lastfm_file = os.path.join(directory, f'lastfm_{year}.json')
+    collection_io.save_collection(collection, collection_file)
+    with open(lastfm_file, 'w') as f:
+        json.dump(make_lastfm(collection, year, seed), f, indent=2)
+    return collection_file, lastfm_file
+
+def discogs_item(record):
+    """Turn a stored record back into a Discogs collection page item"""
+    return {
+        'id': record['id'],
+        'instance_id': record['instance_id'],
+        'date_added': f"{record['date_added']}-08:00",
+        'basic_information': {
+            'title': record['title'],
+            'year': record['year'],
+            'artists': [{'name': artist} for artist in record['artist']],
+            'formats': record['formats'],
+            'labels': [{'name': label} for label in record['labels']],
+            'genres': record['genres'],
+            'styles': record['styles']
+        }
+    }
+
+def write_cassette(path, collection, username, per_page=100):
+    """Write a replay cassette holding a Discogs collection and the russ.fm index.
+
+    Every page is recorded in both sort orders, so the direct year fetch
+    and store syncs can run against http_replay.ReplayServer offline.
+    """
+    cassette = http_replay.Cassette(path)
+    cassette.interactions = {}
+    headers = {'Content-Type': 'application/json'}
+    items = sorted((discogs_item(record) for record in collection), key=lambda item: item['date_added'])
+    pages = -(-len(items) // per_page)
+    for sort_order, ordered in (('asc', items), ('desc', items[::-1])):
+        for page in range(1, pages + 1):
+            url = (f"https://api.discogs.com/users/{username}/collection/folders/0/releases"
+                   f"?page={page}&per_page={per_page}&sort=added&sort_order={sort_order}")
+            body = {
+                'pagination': {'page': page, 'pages': pages, 'per_page': per_page, 'items': len(items)},
+                'releases': ordered[(page - 1) * per_page:page * per_page]
+            }
+            cassette.add(http_replay.request_key('GET', url), 200, headers, json.dumps(body).encode('utf-8'))
+    
+    documents = [{
+        'discogsRelease': str(record['id']),
+        'coverImage': record['cover_image'],
+        'artistImage': record['artist_image'],
+        'albumUri': record['album_uri'],
+        'artistUri': record['artist_uri']
+    } for record in collection if record['album_uri']]
+    cassette.add(http_replay.request_key('GET', 'https://www.russ.fm/index.json'), 200,
+                 dict(headers, ETag='"synthetic"'), json.dumps({'documents': documents}).encode('utf-8'))
+    cassette.save()
+    return cassette
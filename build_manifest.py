@@ -0,0 +1,112 @@
+import os
+import json
+import shutil
+import hashlib
+import tempfile
+import logging
+import metrics
+from collection_store import CACHE_DIR
+
+logger = logging.getLogger(__name__)
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+MANIFEST_FILE = os.path.join(CACHE_DIR, 'build-manifest.json')
+
+# Modules whose code changes what ends up in the rendered pages: everything
+# an offline build imports except metrics.py and this module's bookkeeping
+CODE_FILES = ['collection_columns.py', 'collection_io.py', 'collection_store.py', 'generate_report.py',
+              'generate_wrap.py', 'image_pipeline.py', 'publish.py', 'render.py', 'rollup.py', 'settings.py']
+
+def hash_file(path):
+    """Return the sha256 of a file's contents, or None if it does not exist"""
+    if not os.path.exists(path):
+        return None
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 16), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+def code_version():
+    """Hash of the build code, so code changes invalidate every output"""
+    digest = hashlib.sha256()
+    for name in CODE_FILES:
+        digest.update(name.encode())
+        digest.update((hash_file(os.path.join(BASE_DIR, name)) or '').encode())
+    return digest.hexdigest()
+
+def hash_inputs(paths, extra=None):
+    """Combine the hashes of input files (and any extra settings) into one key"""
+    digest = hashlib.sha256()
+    for path in paths:
+        digest.update(os.path.relpath(path, BASE_DIR).encode())
+        digest.update((hash_file(path) or 'missing').encode())
+    if extra is not None:
+        digest.update(json.dumps(extra, sort_keys=True, default=str).encode())
+    return digest.hexdigest()
+
+def load_manifest(manifest_file=None):
+    """Load the build manifest mapping outputs to the hash of their inputs"""
+    manifest_file = manifest_file or MANIFEST_FILE
+    if not os.path.exists(manifest_file):
+        return {}
+    with open(manifest_file, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+def save_manifest(manifest, manifest_file=None):
+    """Atomically write the build manifest"""
+    manifest_file = manifest_file or MANIFEST_FILE
+    os.makedirs(os.path.dirname(manifest_file), exist_ok=True)
+    with atomic_open(manifest_file) as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+
+def is_up_to_date(manifest, output, inputs_hash):
+    """Check whether an output exists and was built from the same inputs"""
+    up_to_date = os.path.exists(output) and manifest.get(os.path.relpath(output, BASE_DIR)) == inputs_hash
+    metrics.cache_hit('build_manifest', up_to_date)
+    return up_to_date
+
+def record(manifest, output, inputs_hash):
+    """Remember the inputs an output was built from"""
+    manifest[os.path.relpath(output, BASE_DIR)] = inputs_hash
+
+class atomic_open:
+    """Write a text file via a temporary file that replaces it on success"""
+
+    def __init__(self, path, mode='w'):
+        self.path = path
+        self.mode = mode
+
+    def __enter__(self):
+        directory = os.path.dirname(os.path.abspath(self.path))
+        os.makedirs(directory, exist_ok=True)
+        fd, self.tmp_path = tempfile.mkstemp(dir=directory, prefix='.tmp-')
+        encoding = None if 'b' in self.mode else 'utf-8'
+        self.file = os.fdopen(fd, self.mode, encoding=encoding)
+        return self.file
+
+    def __exit__(self, exc_type, exc, tb):
+        self.file.close()
+        if exc_type is None:
+            os.chmod(self.tmp_path, 0o644)
+            os.replace(self.tmp_path, self.path)
+        else:
+            os.unlink(self.tmp_path)
+        return False
+
+def copy_if_changed(src, dst, manifest):
+    """Atomically copy src to dst unless dst is already up to date.
+
+    Returns True if the file was copied.
+    """
+    src_hash = hash_file(src)
+    if is_up_to_date(manifest, dst, src_hash):
+        return False
+    directory = os.path.dirname(os.path.abspath(dst))
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.tmp-')
+    os.close(fd)
+    shutil.copy2(src, tmp_path)
+    os.replace(tmp_path, dst)
+    record(manifest, dst, src_hash)
+    return True
@@ -0,0 +1,127 @@
+import os
+import json
+import time
+import shutil
+import tempfile
+import logging
+import metrics
+from collection_store import CACHE_DIR
+
+logger = logging.getLogger(__name__)
+
+CHECKPOINT_DIR = os.path.join(CACHE_DIR, 'checkpoints')
+
+def checkpoint_path(name):
+    return os.path.join(CHECKPOINT_DIR, f"{name}.json")
+
+def part_path(name, part):
+    return os.path.join(CHECKPOINT_DIR, name, f"{part}.json")
+
+def load(name, params=None):
+    """Return the state saved under name, or None.
+
+    A checkpoint saved with different params (e.g. for a full sync when an
+    incremental one is running) is ignored.
+    """
+    path = checkpoint_path(name)
+    if not os.path.exists(path):
+        return None
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            saved = json.load(f)
+    except ValueError:
+        logger.warning(f"Ignoring unreadable checkpoint {path}")
+        return None
+    if saved.get('params') != params:
+        logger.info(f"Ignoring checkpoint {name}: it was saved for a different run")
+        return None
+    return saved['state']
+
+def save(name, state, params=None):
+    """Durably replace the checkpoint for name.
+
+    The state is written to a temporary file, fsynced and renamed over the
+    old checkpoint, so a crash leaves either the previous cursor or the new
+    one, never a torn file.
+    """
+    _write_json(checkpoint_path(name), {'params': params, 'saved_at': time.time(), 'state': state})
+    metrics.count('checkpoints.saved')
+
+def save_part(name, part, data):
+    """Durably write one piece of a checkpoint's data, such as a fetched page.
+
+    Each part is written once, so the checkpoint itself only has to hold a
+    small cursor and saving it costs the same on the last page as the first.
+    """
+    _write_json(part_path(name, part), data)
+    metrics.count('checkpoints.parts_saved')
+
+def load_part(name, part):
+    """Return a part saved under name, or None"""
+    path = part_path(name, part)
+    if not os.path.exists(path):
+        return None
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except ValueError:
+        logger.warning(f"Ignoring unreadable checkpoint part {path}")
+        return None
+
+def _write_json(path, data):
+    directory = os.path.dirname(path)
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.tmp-')
+    try:
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            # dumps() runs the C encoder; dump() streams through the Python one
+            f.write(json.dumps(data, ensure_ascii=False, separators=(',', ':')))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.unlink(tmp_path)
+        raise
+    _fsync_dir(directory)
+
+def _fsync_dir(directory):
+    # Makes the rename itself durable; directories cannot be opened on Windows
+    try:
+        fd = os.open(directory, os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+def clear(name):
+    """Remove a checkpoint and its parts once the work it tracks has finished"""
+    path = checkpoint_path(name)
+    if os.path.exists(path):
+        os.unlink(path)
+        logger.debug(f"Cleared checkpoint {name}")
+    shutil.rmtree(os.path.join(CHECKPOINT_DIR, name), ignore_errors=True)
+
+def resume_state(name, params=None, resume=False):
+    """Return the state to continue from, or None to start from scratch.
+
+    Without resume a leftover checkpoint is discarded, so a later --resume
+    never picks up a cursor that is older than the work done since.
+    """
+    if not resume:
+        if os.path.exists(checkpoint_path(name)):
+            logger.info(f"Discarding checkpoint {name} (pass --resume to continue from it)")
+        clear(name)
+        return None
+    state = load(name, params)
+    if state is None:
+        # Parts left by a different run must not be mixed into this one
+        clear(name)
+    else:
+        logger.info(f"Resuming from checkpoint {name}")
+        metrics.count('checkpoints.resumed')
+    return state
@@ -0,0 +1,165 @@
+import heapq
+from collections import Counter
+from datetime import datetime
+
+np = None  # imported on first use by load_numpy(); NumPy is optional
+
+def load_numpy():
+    """Import NumPy the first time it is needed, or return None if it is not installed.
+
+    Keeping the import lazy means the standard dict path never pays for it.
+    """
+    global np
+    if np is None:
+        try:
+            import numpy
+        except ImportError:  # the dict path works without it
+            return None
+        np = numpy
+    return np
+
+class Categorical:
+    """Interned values with integer codes assigned in first-seen order"""
+    
+    def __init__(self):
+        self.values = []
+        self.codes = {}
+    
+    def code(self, value):
+        code = self.codes.get(value)
+        if code is None:
+            code = self.codes[value] = len(self.values)
+            self.values.append(value)
+        return code
+
+class ColumnarCollection:
+    """Array-backed collection for analytics.
+    
+    Single-valued fields (artist key, month) are one array entry per
+    record. Multi-valued fields (genres, styles, formats, labels) are stored
+    as one flat code array per field. Codes are assigned in first-seen
+    order, so counting them reproduces the dict path's Counter ordering.
+    Only records with russ.fm URLs are kept, as in analyze_collection.
+    
+    The columns are built in one pass over records, which may be a stream,
+    and only each record's card (see generate_report.card_record) is kept
+    next to them, so the full records are never held in memory.
+    """
+    
+    def __init__(self, records):
+        if load_numpy() is None:
+            raise ImportError("The columnar representation needs NumPy (pip install numpy)")
+        # Imported here; generate_report imports this module
+        from generate_report import card_record
+        
+        self.cards = []
+        self.artists = Categorical()
+        self.artist_images = []  # image of each artist's first record, by artist code
+        self.genres = Categorical()
+        self.styles = Categorical()
+        self.formats = Categorical()
+        self.labels = Categorical()
+        artist_codes, month_codes = [], []
+        genre_codes, style_codes, format_codes, label_codes = [], [], [], []
+        
+        for record in records:
+            if record['album_uri'] is None or record['artist_uri'] is None:
+                continue
+            self.cards.append(card_record(record))
+            month_codes.append(datetime.fromisoformat(record['date_added']).month)
+            
+            artists = record.get('artist', [])
+            if isinstance(artists, str):
+                artists = [artists]
+            code = self.artists.code(' & '.join(artists) if len(artists) > 1 else artists[0])
+            if code == len(self.artist_images):
+                self.artist_images.append(record.get('artist_image', ''))
+            artist_codes.append(code)
+            
+            genre_codes.extend(self.genres.code(genre) for genre in record['genres'])
+            style_codes.extend(self.styles.code(style) for style in record.get('styles', []))
+            format_codes.extend(
+                self.formats.code(f"{format_info['name']} ({', '.join(format_info['descriptions'])})")
+                for format_info in record['formats']
+            )
+            label_codes.extend(self.labels.code(label) for label in record['labels'])
+        
+        self.artist = np.array(artist_codes, dtype=np.int32)
+        self.month = np.array(month_codes, dtype=np.int8)
+        self.genre = np.array(genre_codes, dtype=np.int32)
+        self.style = np.array(style_codes, dtype=np.int32)
+        self.format = np.array(format_codes, dtype=np.int32)
+        self.label = np.array(label_codes, dtype=np.int32)
+    
+    def __len__(self):
+        return len(self.cards)
+
+def count_codes(codes, categorical):
+    """Vectorized group-by count returned as a Counter in first-seen order"""
+    counts = np.bincount(codes, minlength=len(categorical.values))
+    return Counter({value: int(count) for value, count in zip(categorical.values, counts)})
+
+def analyze_columnar(columns, year, recent_additions=10, top_artists=12):
+    """Compute analyze_collection's stats from a ColumnarCollection.
+    
+    Produces exactly the same dict as the record-by-record path.
+    """
+    # Imported here; generate_report imports this module
+    from generate_report import MONTHS as months, create_month_id, date_added_key as date_key
+    records = columns.cards
+    
+    # Months in first-seen order, counted with one bincount
+    month_counts = np.bincount(columns.month, minlength=13)
+    _, first_rows = np.unique(columns.month, return_index=True)
+    monthly_adds = {}
+    for row in sorted(first_rows):
+        month_number = int(columns.month[row])
+        monthly_adds[months[month_number - 1]] = int(month_counts[month_number])
+    
+    # Records grouped by month, each month sorted by date, months in date order
+    order = sorted(range(len(records)), key=lambda row: records[row]['date_added'])
+    records_by_month = {}
+    for row in order:
+        records_by_month.setdefault(months[columns.month[row] - 1], []).append(records[row])
+    
+    # Artists: counts via bincount, image from each artist's first record
+    artist_counts = count_codes(columns.artist, columns.artists)
+    _, first_artist_rows = np.unique(columns.artist, return_index=True)
+    top_artists_data = []
+    for artist, count in sorted(artist_counts.items(), key=lambda x: x[1], reverse=True):
+        if artist.lower() != "various":  # Skip 'Various' artists
+            code = columns.artists.codes[artist]
+            top_artists_data.append({
+                'name': artist,
+                'count': count,
+                'image': columns.artist_images[code],
+                'records': [records[first_artist_rows[code]]]
+            })
+            if len(top_artists_data) == top_artists:
+                break
+    
+    genres = count_codes(columns.genre, columns.genres)
+    styles = count_codes(columns.style, columns.styles)
+    formats = count_codes(columns.format, columns.formats)
+    labels = count_codes(columns.label, columns.labels)
+    
+    return {
+        'total_records': len(records),
+        'monthly_adds': monthly_adds,
+        'top_genres': dict(genres.most_common(5)),
+        'top_styles': dict(styles.most_common(5)),
+        'top_formats': dict(formats.most_common(5)),
+        'top_labels': dict(labels.most_common(5)),
+        'monthly_data': [int(month_counts[number]) for number in range(1, 13)],
+        'months': months,
+        'month_ids': {month: create_month_id(month) for month in months},
+        'records_by_month': records_by_month,
+        'top_artists': top_artists_data,
+        'recent_additions': heapq.nlargest(recent_additions, records, key=date_key),
+        'year': year,
+        'genres': dict(genres),
+        'styles': dict(styles),
+        'formats': dict(formats),
+        'labels': dict(labels),
+        'artists': dict(artist_counts)
+    }
@@ -0,0 +1,110 @@
+import os
+import json
+import gzip
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Collection file formats, by the extension they are saved with
+FORMATS = {
+    'json': '.json',
+    'ndjson': '.ndjson',
+    'ndjson.gz': '.ndjson.gz'
+}
+DEFAULT_FORMAT = 'ndjson'
+
+def file_format(path):
+    """Work out a collection file's format from its name"""
+    for fmt, ext in sorted(FORMATS.items(), key=lambda entry: -len(entry[1])):
+        if path.endswith(ext):
+            return fmt
+    raise ValueError(f"Unknown collection file format: {path}")
+
+def collection_path(base_dir, year, fmt=DEFAULT_FORMAT):
+    return os.path.join(base_dir, f"collection_{year}{FORMATS[fmt]}")
+
+def find_collection_file(base_dir, year):
+    """Return the year's collection file in any format, newest first, or None"""
+    candidates = [collection_path(base_dir, year, fmt) for fmt in FORMATS]
+    existing = [path for path in candidates if os.path.exists(path)]
+    return max(existing, key=os.path.getmtime) if existing else None
+
+def _open(path, mode, compressed):
+    if compressed:
+        return gzip.open(path, mode + 't', encoding='utf-8')
+    return open(path, mode, encoding='utf-8')
+
+def iter_collection(path):
+    """Yield the records in a collection file one at a time.
+    
+    NDJSON files are read line by line, so only one record is in memory at
+    a time. Legacy .json files are a single array and are parsed whole.
+    """
+    if file_format(path) == 'json':
+        with open(path, 'r', encoding='utf-8') as f:
+            yield from json.load(f)
+        return
+    
+    with _open(path, 'r', path.endswith('.gz')) as f:
+        for line in f:
+            if line.strip():
+                yield json.loads(line)
+
+def load_collection(path):
+    return list(iter_collection(path))
+
+class CollectionWriter:
+    """Stream records into a collection file as they arrive.
+    
+    Records go to a hidden ".partial" file next to the target, which
+    replaces the target once the writer closes cleanly and is deleted if
+    writing fails, so the target is never left half written. The name is
+    fixed per target, so a run killed outright leaves at most one partial
+    file, which the next write of that year overwrites. The legacy .json
+    format is written incrementally too, byte-for-byte the same as
+    json.dump(items, f, indent=2, ensure_ascii=False).
+    """
+    
+    def __init__(self, path):
+        self.path = path
+        self.format = file_format(path)
+        self.count = 0
+    
+    def __enter__(self):
+        directory = os.path.dirname(os.path.abspath(self.path))
+        os.makedirs(directory, exist_ok=True)
+        self.tmp_path = os.path.join(directory, f".{os.path.basename(self.path)}.partial")
+        self.file = _open(self.tmp_path, 'w', self.path.endswith('.gz'))
+        if self.format == 'json':
+            self.file.write('[')
+        return self
+    
+    def write(self, record):
+        if self.format == 'json':
+            item = json.dumps(record, indent=2, ensure_ascii=False).replace('\n', '\n  ')
+            self.file.write(f"{',' if self.count else ''}\n  {item}")
+        else:
+            self.file.write(json.dumps(record, ensure_ascii=False, separators=(',', ':')))
+            self.file.write('\n')
+        self.count += 1
+    
+    def write_all(self, records):
+        for record in records:
+            self.write(record)
+        return self.count
+    
+    def __exit__(self, exc_type, exc, tb):
+        if self.format == 'json':
+            self.file.write('\n]' if self.count else ']')
+        self.file.close()
+        if exc_type is None:
+            os.replace(self.tmp_path, self.path)
+        else:
+            os.unlink(self.tmp_path)
+            logger.warning(f"Discarded {self.count} records written to {self.path} before the failure")
+        return False
+
+def save_collection(items, path):
+    """Write a whole collection in the format given by the file name"""
+    with CollectionWriter(path) as writer:
+        return writer.write_all(items)
@@ -0,0 +1,122 @@
+import os
+import json
+import sqlite3
+from datetime import datetime
+import logging
+from settings import load_env
+
+logger = logging.getLogger(__name__)
+
+# Every cache path derives from CACHE_DIR when modules are imported, so
+# .env is loaded here, before anything reads it
+load_env()
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+CACHE_DIR = os.getenv('VINYL_CACHE_DIR', os.path.join(BASE_DIR, '.cache'))
+DEFAULT_DB = os.path.join(CACHE_DIR, 'collection.sqlite3')
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS items (
+    instance_id INTEGER PRIMARY KEY,
+    release_id INTEGER NOT NULL,
+    date_added TEXT NOT NULL,
+    year_added INTEGER NOT NULL,
+    data TEXT NOT NULL,
+    synced_at TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS items_year_added ON items (year_added, date_added);
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+"""
+
+def open_store(db_file=None):
+    """Open (and create if needed) the local collection store"""
+    if db_file is None:
+        db_file = DEFAULT_DB
+    os.makedirs(os.path.dirname(os.path.abspath(db_file)), exist_ok=True)
+    conn = sqlite3.connect(db_file)
+    conn.executescript(SCHEMA)
+    return conn
+
+def set_meta(conn, key, value):
+    """Write a value to the store's meta table"""
+    conn.execute(
+        'INSERT INTO meta (key, value) VALUES (?, ?) '
+        'ON CONFLICT(key) DO UPDATE SET value = excluded.value',
+        (key, value)
+    )
+
+def upsert_items(conn, items):
+    """Insert or update collection items keyed by instance id.
+
+    Each item is a release_data dict as built by fetch_collection plus an
+    'instance_id' key. Returns the number of rows that were new or changed.
+    """
+    synced_at = datetime.now().isoformat()
+    changed = 0
+    for item in items:
+        data = json.dumps(item, ensure_ascii=False, sort_keys=True)
+        row = conn.execute(
+            'SELECT data FROM items WHERE instance_id = ?', (item['instance_id'],)
+        ).fetchone()
+        if row and row[0] == data:
+            continue
+        conn.execute(
+            'INSERT INTO items (instance_id, release_id, date_added, year_added, data, synced_at) '
+            'VALUES (?, ?, ?, ?, ?, ?) '
+            'ON CONFLICT(instance_id) DO UPDATE SET release_id = excluded.release_id, '
+            'date_added = excluded.date_added, year_added = excluded.year_added, '
+            'data = excluded.data, synced_at = excluded.synced_at',
+            (
+                item['instance_id'],
+                item['id'],
+                item['date_added'],
+                datetime.fromisoformat(item['date_added']).year,
+                data,
+                synced_at
+            )
+        )
+        changed += 1
+    return changed
+
+def delete_missing(conn, instance_ids):
+    """Remove items that are no longer in the Discogs collection"""
+    known = {row[0] for row in conn.execute('SELECT instance_id FROM items')}
+    missing = known - set(instance_ids)
+    conn.executemany('DELETE FROM items WHERE instance_id = ?', [(i,) for i in missing])
+    return len(missing)
+
+def has_instance(conn, instance_id):
+    """Check whether an instance id is already stored"""
+    row = conn.execute('SELECT 1 FROM items WHERE instance_id = ?', (instance_id,)).fetchone()
+    return row is not None
+
+def latest_date_added(conn):
+    """Return the newest date_added in the store, or None if it is empty"""
+    row = conn.execute('SELECT MAX(date_added) FROM items').fetchone()
+    return row[0] if row else None
+
+def count_items(conn):
+    """Return the number of stored collection items"""
+    return conn.execute('SELECT COUNT(*) FROM items').fetchone()[0]
+
+def years(conn):
+    """Return the years that have stored items, oldest first"""
+    return [row[0] for row in conn.execute('SELECT DISTINCT year_added FROM items ORDER BY year_added')]
+
+def years_synced_since(conn, since):
+    """Return the years with items added or changed since an ISO timestamp"""
+    return [row[0] for row in conn.execute(
+        'SELECT DISTINCT year_added FROM items WHERE synced_at >= ? ORDER BY year_added', (since,)
+    )]
+
+def iter_year(conn, year):
+    """Yield the stored items added in the given year, oldest first"""
+    rows = conn.execute(
+        'SELECT data FROM items WHERE year_added = ? ORDER BY date_added, instance_id',
+        (year,)
+    )
+    for row in rows:
+        yield json.loads(row[0])
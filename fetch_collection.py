@@ -5,7 +5,12 @@ from datetime import datetime
 from dotenv import load_dotenv
 import discogs_client
 import logging
-import requests
+from concurrent.futures import ThreadPoolExecutor
+import checkpoint
+import collection_io
+import collection_store
+import http_client
+import metrics
 
 # Load environment variables
 load_dotenv()
@@ -13,23 +18,56 @@ load_dotenv()
 # Configuration
 USERNAME = os.getenv('DISCOGS_USERNAME', 'russmck')
 MAX_RETRIES = 3
-RETRY_DELAY = int(os.getenv('DISCOGS_RATE_LIMIT_DELAY', '2'))  # seconds between retries
+RETRY_DELAY = int(os.getenv('DISCOGS_RATE_LIMIT_DELAY', '2'))  # base backoff delay in seconds
+PER_PAGE = 100  # Largest page size the Discogs API allows
+CONCURRENCY = int(os.getenv('DISCOGS_CONCURRENCY', '4'))  # parallel page requests
+API_URL = os.getenv('DISCOGS_API_URL')  # override to point at a local stub server
+RUSS_FM_INDEX_URL = os.getenv('RUSS_FM_INDEX_URL', 'https://www.russ.fm/index.json')
+RUSS_FM_MAX_AGE = int(os.getenv('RUSS_FM_MAX_AGE', '3600'))  # seconds before revalidating
+RUSS_FM_CACHE_DIR = os.path.join(collection_store.CACHE_DIR, 'russ_fm')
+EMPTY_IMAGE_DATA = {'cover_image': None, 'artist_image': None, 'album_uri': None, 'artist_uri': None}
 
-# Set up logging based on environment variable
+# Log level for command line runs, based on environment variable
 log_level = logging.DEBUG if os.getenv('DEBUG', 'false').lower() == 'true' else logging.INFO
-logging.basicConfig(level=log_level)
 logger = logging.getLogger(__name__)
 
+# Shared by every Discogs client so concurrent callers draw from one budget
+rate_limiter = http_client.RateLimiter(limit=60, window=60.0, base_delay=RETRY_DELAY, name='discogs')
+
+class RateLimitedFetcher:
+    """discogs_client fetcher that sends requests through the shared session.
+
+    Every request waits on the shared rate limiter, updates it from the
+    X-Discogs-Ratelimit headers and is retried with backoff on 429/5xx.
+    """
+
+    def __init__(self, user_token, limiter):
+        self.user_token = user_token
+        self.limiter = limiter
+
+    def fetch(self, client, method, url, data=None, headers=None, json=True):
+        headers = dict(headers or {})
+        headers['Authorization'] = f"Discogs token={self.user_token}"
+        response = http_client.request_with_retries(
+            method, url, limiter=self.limiter, max_retries=MAX_RETRIES,
+            data=data, headers=headers
+        )
+        return response.content, response.status_code
+
 def get_discogs_client():
-    """Initialize and return Discogs client"""
+    """Initialize and return a rate limited Discogs client"""
     token = os.getenv('DISCOGS_TOKEN')
     if not token:
         raise ValueError("Please set DISCOGS_TOKEN in your .env file")
     
-    return discogs_client.Client(
+    client = discogs_client.Client(
         'VinylUnwrapped/1.0',
         user_token=token
     )
+    client._fetcher = RateLimitedFetcher(token, rate_limiter)
+    if API_URL:
+        client._base_url = API_URL.rstrip('/')
+    return client
 
 def get_format_info(format_obj):
     """Safely extract format information"""
@@ -53,121 +91,478 @@ def get_label_info(label):
         return label.get('name', 'Unknown Label')
     return getattr(label, 'name', 'Unknown Label')
 
-def fetch_russ_fm_data():
-    """Fetch image data from russ.fm"""
+def fetch_russ_fm_data(etag=None, last_modified=None):
+    """Fetch image data from russ.fm, revalidating against cached validators.
+
+    Returns (documents, response). documents is None when the server answers
+    304 Not Modified; both are None on error.
+    """
+    headers = {}
+    if etag:
+        headers['If-None-Match'] = etag
+    if last_modified:
+        headers['If-Modified-Since'] = last_modified
     try:
-        response = requests.get('https://www.russ.fm/index.json')
+        response = http_client.request_with_retries('GET', RUSS_FM_INDEX_URL, headers=headers)
+        if response.status_code == 304:
+            logger.debug("russ.fm index not modified")
+            return None, response
         response.raise_for_status()
-        return response.json().get('documents', [])
+        return response.json().get('documents', []), response
     except Exception as e:
         logger.error(f"Error fetching russ.fm data: {str(e)}")
-        return []
+        return None, None
 
 def create_image_lookup(russ_fm_data):
-    """Create lookup tables for cover and artist images"""
-    cover_images = {}
-    artist_images = {}
-    album_uris = {}
-    artist_uris = {}
-    
+    """Create a single release id -> image and link record lookup"""
+    lookup = {}
     for item in russ_fm_data:
         discogs_id = item.get('discogsRelease')
         if discogs_id:
-            cover_images[discogs_id] = item.get('coverImage')
-            artist_images[discogs_id] = item.get('artistImage')
-            album_uris[discogs_id] = item.get('albumUri')
-            artist_uris[discogs_id] = item.get('artistUri')
+            lookup[str(discogs_id)] = {
+                'cover_image': item.get('coverImage'),
+                'artist_image': item.get('artistImage'),
+                'album_uri': item.get('albumUri'),
+                'artist_uri': item.get('artistUri')
+            }
+    return lookup
+
+def _write_json_atomic(path, data):
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(data, f, ensure_ascii=False, separators=(',', ':'))
+    os.replace(tmp_path, path)
+
+def load_image_lookup(max_age=None):
+    """Return the russ.fm image lookup, using the on-disk cache when possible.
+
+    Only the prebuilt lookup is kept on disk, so a cache hit never parses
+    the full index. Within max_age seconds of the last check no request is
+    made at all; after that the index is revalidated with ETag and
+    If-Modified-Since, so an unchanged index costs a single 304.
+    """
+    if max_age is None:
+        max_age = RUSS_FM_MAX_AGE
+    os.makedirs(RUSS_FM_CACHE_DIR, exist_ok=True)
+    lookup_file = os.path.join(RUSS_FM_CACHE_DIR, 'lookup.json')
+    meta_file = os.path.join(RUSS_FM_CACHE_DIR, 'meta.json')
+    
+    meta = {}
+    if os.path.exists(meta_file) and os.path.exists(lookup_file):
+        with open(meta_file, 'r', encoding='utf-8') as f:
+            meta = json.load(f)
+    
+    if meta and time.time() - meta.get('checked_at', 0) < max_age:
+        logger.debug("Using cached russ.fm lookup")
+        metrics.cache_hit('russ_fm', True)
+        with open(lookup_file, 'r', encoding='utf-8') as f:
+            return json.load(f)
     
-    return cover_images, artist_images, album_uris, artist_uris
+    documents, response = fetch_russ_fm_data(meta.get('etag'), meta.get('last_modified'))
+    metrics.cache_hit('russ_fm', documents is None and response is not None)
+    if documents is None:
+        if not meta:
+            return {}
+        if response is not None:
+            # 304: the cached lookup is still current
+            meta['checked_at'] = time.time()
+            _write_json_atomic(meta_file, meta)
+        else:
+            logger.warning("Using stale russ.fm lookup")
+        with open(lookup_file, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    
+    lookup = create_image_lookup(documents)
+    _write_json_atomic(lookup_file, lookup)
+    _write_json_atomic(meta_file, {
+        'etag': response.headers.get('ETag'),
+        'last_modified': response.headers.get('Last-Modified'),
+        'checked_at': time.time()
+    })
+    logger.info(f"Cached russ.fm lookup with {len(lookup)} releases")
+    return lookup
 
-def fetch_collection(year):
-    """Fetch collection items added in specified year"""
+def parse_date_added(value):
+    """Parse a Discogs timestamp into the naive local datetime we store.
+
+    discogs_client drops the UTC offset when it parses timestamps, so we do
+    the same to keep date_added values identical to earlier exports.
+    """
+    return datetime.fromisoformat(value).replace(tzinfo=None)
+
+def build_release_data(item):
+    """Build the stored release record from a collection page item.
+
+    Everything comes from the item's basic_information, so no extra
+    requests are made per release.
+    """
+    info = item.get('basic_information', {})
+    logger.debug("Processing release: %s", info.get('title'))
+    logger.debug("Format data: %s", info.get('formats'))
+    
+    return {
+        'id': item['id'],
+        'instance_id': item['instance_id'],
+        'title': info.get('title'),
+        'artist': [artist['name'] for artist in info.get('artists', [])],
+        'date_added': parse_date_added(item['date_added']).isoformat(),
+        'year': info.get('year'),
+        'formats': [get_format_info(format_obj) for format_obj in info.get('formats', [])],
+        'labels': [get_label_info(label) for label in info.get('labels', [])],
+        'genres': info.get('genres', []),
+        'styles': info.get('styles', [])
+    }
+
+def needs_enrichment(release_data):
+    """Check whether a release record is missing fields only the full release has"""
+    return not release_data['genres'] or not release_data['styles'] or not release_data['year']
+
+def enrich_release_data(d, release_data, request_stats):
+    """Fill in missing fields from the full release (one extra request)"""
+    request_stats['enrich_requests'] += 1
+    release = d._get(f"{d._base_url}/releases/{release_data['id']}")
+    for key in ('genres', 'styles', 'year'):
+        if not release_data[key] and release.get(key):
+            release_data[key] = release[key]
+    return release_data
+
+def add_image_data(release_data, image_lookup):
+    """Attach russ.fm image and link data to a release record"""
+    release_data.update(image_lookup.get(str(release_data['id']), EMPTY_IMAGE_DATA))
+    return release_data
+
+def fetch_page(d, page, sort_order='asc'):
+    """Fetch a single collection page sorted by date added.
+
+    Pacing and retries on rate limits happen in the client's fetcher.
+    Returns the raw page payload, or None once we have run past the last page.
+    """
+    url = (f"{d._base_url}/users/{USERNAME}/collection/folders/0/releases"
+           f"?page={page}&per_page={PER_PAGE}&sort=added&sort_order={sort_order}")
+    try:
+        logger.debug(f"Fetching page {page}")
+        return d._get(url)
+    except discogs_client.exceptions.HTTPError as e:
+        if e.status_code == 404:  # Page not found - we've reached the end
+            logger.debug("Reached the last page")
+            return None
+        raise
+
+def iter_pages(d, pages, sort_order='asc', concurrency=None):
+    """Fetch several collection pages concurrently, yielding them in order.
+
+    Requests run on a bounded thread pool and still go through the shared
+    rate limiter, so the concurrency cap only controls how many round trips
+    are in flight. Payloads are yielded in the order the pages were given,
+    as soon as each is available, so callers can checkpoint every page
+    before a later one fails.
+    """
+    if concurrency is None:
+        concurrency = CONCURRENCY
+    pages = list(pages)
+    if concurrency <= 1 or len(pages) <= 1:
+        for page in pages:
+            yield fetch_page(d, page, sort_order)
+        return
+    
+    with ThreadPoolExecutor(max_workers=min(concurrency, len(pages))) as executor:
+        yield from executor.map(lambda page: fetch_page(d, page, sort_order), pages)
+
+def find_first_page(get_page, pages, year):
+    """Find the first page that can contain items added in year.
+
+    Pages must be sorted by date added, oldest first. Most runs are for
+    recent years, so we gallop back from the last page (1, 2, 4, ... pages)
+    until we pass the start of the year and then binary search inside that
+    bracket. Returns pages + 1 if every item is older than the year.
+    """
+    def ends_before_year(page):
+        releases = get_page(page)
+        return not releases or parse_date_added(releases[-1]['date_added']).year < year
+    
+    if ends_before_year(pages):
+        return pages + 1
+    
+    # Gallop backwards: hi always ends in or after the year
+    hi = pages
+    step = 1
+    lo = hi - step
+    while lo >= 1 and not ends_before_year(lo):
+        hi = lo
+        step *= 2
+        lo = hi - step
+    if lo < 1:
+        lo = 0
+    
+    # Binary search: lo ends before the year (or is page 0), hi does not
+    while hi - lo > 1:
+        mid = (lo + hi) // 2
+        if ends_before_year(mid):
+            lo = mid
+        else:
+            hi = mid
+    return hi
+
+def iter_fetch_collection(year, enrich=False, resume=False):
+    """Yield collection items added in specified year, oldest first.
+
+    The collection is requested sorted by date added so we can jump straight
+    to the pages covering the year, which are then fetched concurrently. With
+    enrich=True, releases missing genres, styles or year are looked up
+    individually. Every fetched page is checkpointed, so with resume=True a
+    run that failed part way only requests the pages it is still missing.
+    """
     d = get_discogs_client()
-    user = d.user(USERNAME)
-    collection = user.collection_folders[0].releases
     
     # Get image lookups from russ.fm
-    cover_images, artist_images, album_uris, artist_uris = create_image_lookup(fetch_russ_fm_data())
+    with metrics.stage('russ_fm'):
+        image_lookup = load_image_lookup()
     
-    items = []
-    page = 1
+    request_stats = {'page_requests': 0, 'enrich_requests': 0}
+    checkpoint_name = f"discogs-{year}"
+    checkpoint_params = {'username': USERNAME, 'per_page': PER_PAGE}
+    # The checkpoint only holds the page count and the year's page bracket;
+    # each fetched page is saved once as a part of it
+    state = checkpoint.resume_state(checkpoint_name, checkpoint_params, resume) or {
+        'page_count': 0, 'first': None, 'last': None
+    }
+    page_cache = {}
     
-    while True:
-        try:
-            logger.debug(f"Fetching page {page}")
-            releases = collection.page(page)
-            if not releases:
-                logger.debug("No more releases found")
-                break
-                
-            for item in releases:
-                try:
-                    # Get the date added - it's already a datetime object
-                    date_added = item.date_added
-                    
-                    # Check if it was added in the specified year
-                    if date_added.year == year:
-                        logger.debug(f"Processing release: {item.release.title}")
-                        logger.debug(f"Format data: {item.release.formats}")
-                        
-                        release_data = {
-                            'id': item.id,
-                            'title': item.release.title,
-                            'artist': [artist.name for artist in item.release.artists],
-                            'date_added': item.date_added.isoformat(),
-                            'year': item.release.year,
-                            'formats': [get_format_info(format_obj) for format_obj in item.release.formats],
-                            'labels': [get_label_info(label) for label in item.release.labels],
-                            'genres': item.release.genres,
-                            'styles': item.release.styles if hasattr(item.release, 'styles') else [],
-                            'cover_image': cover_images.get(str(item.release.id)),
-                            'artist_image': artist_images.get(str(item.release.id)),
-                            'album_uri': album_uris.get(str(item.release.id)),
-                            'artist_uri': artist_uris.get(str(item.release.id))
-                        }
-                        items.append(release_data)
-                except Exception as e:
-                    logger.error(f"Error processing item: {str(e)}")
-                    continue
-            
-            # Add delay between pages to respect rate limits
-            time.sleep(RETRY_DELAY)
-            page += 1
-            
-        except discogs_client.exceptions.HTTPError as e:
-            if e.status_code == 429:  # Rate limit exceeded
-                retry_after = int(e.response.headers.get('Retry-After', RETRY_DELAY))
-                logger.warning(f"Rate limit hit, waiting {retry_after} seconds...")
-                time.sleep(retry_after)
+    def store_page(page, payload):
+        page_cache[page] = payload['releases'] if payload else None
+        checkpoint.save_part(checkpoint_name, page, {'releases': page_cache[page]})
+    
+    def have_page(page):
+        # Pages saved by an interrupted run count as fetched
+        if page not in page_cache:
+            saved = checkpoint.load_part(checkpoint_name, page)
+            if saved is not None:
+                page_cache[page] = saved['releases']
+        return page in page_cache
+    
+    def get_page(page):
+        if not have_page(page):
+            payload = fetch_page(d, page)
+            request_stats['page_requests'] += 1
+            store_page(page, payload)
+            if payload and payload['pagination']['pages'] != state['page_count']:
+                state['page_count'] = payload['pagination']['pages']
+                checkpoint.save(checkpoint_name, state, checkpoint_params)
+        return page_cache[page]
+    
+    get_page(1)
+    pages = state['page_count']
+    found = 0
+    if pages:
+        # Locate the first and last pages that can hold the year, then fetch
+        # whatever we have not already seen during the search in parallel
+        if state['first'] is None:
+            state['first'] = find_first_page(get_page, pages, year)
+            state['last'] = min(find_first_page(get_page, pages, year + 1), pages)
+            checkpoint.save(checkpoint_name, state, checkpoint_params)
+        first, last = state['first'], state['last']
+        missing = [page for page in range(first, last + 1) if not have_page(page)]
+        for page, payload in zip(missing, iter_pages(d, missing)):
+            request_stats['page_requests'] += 1
+            store_page(page, payload)
+        logger.debug(f"Items from {year} are on pages {first}-{last} of {pages}")
+    else:
+        first, last = 1, 0
+    
+    for page in range(first, last + 1):
+        releases = page_cache[page]
+        if not releases:
+            logger.debug("No more releases found")
+            break
+        
+        for item in releases:
+            try:
+                # Check if it was added in the specified year
+                if parse_date_added(item['date_added']).year == year:
+                    release_data = build_release_data(item)
+                    if enrich and needs_enrichment(release_data):
+                        enrich_release_data(d, release_data, request_stats)
+                    found += 1
+                    yield add_image_data(release_data, image_lookup)
+            except Exception as e:
+                logger.error(f"Error processing item: {str(e)}")
+                continue
+    
+    checkpoint.clear(checkpoint_name)
+    metrics.count('discogs.page_requests', request_stats['page_requests'])
+    metrics.count('discogs.enrich_requests', request_stats['enrich_requests'])
+    logger.info(f"Found {found} items from {year} "
+                f"({request_stats['page_requests']} page requests, "
+                f"{request_stats['enrich_requests']} release lookups)")
+
+def fetch_collection(year, enrich=False, resume=False):
+    """Fetch collection items added in specified year"""
+    return list(iter_fetch_collection(year, enrich=enrich, resume=resume))
+
+def iter_sync_pages(d, full, request_stats, start_page=1):
+    """Yield (page, payload) pairs for a sync, newest first.
+
+    Incremental syncs fetch one page at a time because they usually stop
+    after the first page or two. Full syncs know they need every page, so
+    once the first page tells us the page count the rest are fetched
+    concurrently. start_page skips pages a resumed sync already stored.
+    """
+    payload = fetch_page(d, start_page, sort_order='desc')
+    request_stats['page_requests'] += 1
+    if not payload:
+        return
+    yield start_page, payload
+    
+    pages = payload['pagination']['pages']
+    if full:
+        rest = range(start_page + 1, pages + 1)
+        request_stats['page_requests'] += len(rest)
+        yield from zip(rest, iter_pages(d, rest, sort_order='desc'))
+        return
+    
+    for page in range(start_page + 1, pages + 1):
+        payload = fetch_page(d, page, sort_order='desc')
+        request_stats['page_requests'] += 1
+        yield page, payload
+
+def sync_collection(conn, full=False, enrich=False, resume=False):
+    """Sync the local collection store with Discogs.
+
+    The collection is paged newest first. An incremental sync stops at the
+    first page that only contains items older than the newest stored item;
+    a full sync walks every page and also drops items that have been removed
+    from the collection. Discogs has no "modified since" filter, so edits to
+    older items are only picked up by a full sync.
+
+    Each stored page is checkpointed with the sync's cutoff. An interrupted
+    incremental sync cannot simply be re-run, because the newest items it
+    stored would move the cutoff past the pages it never reached; with
+    resume=True it carries on after the last stored page instead.
+    """
+    d = get_discogs_client()
+    
+    checkpoint_name = 'discogs-sync'
+    checkpoint_params = {'username': USERNAME, 'full': full, 'per_page': PER_PAGE}
+    state = checkpoint.resume_state(checkpoint_name, checkpoint_params, resume)
+    if state:
+        latest, start_page, seen_ids, changed = state['latest'], state['page'] + 1, state['seen_ids'], state['changed']
+    else:
+        latest = None if full else collection_store.latest_date_added(conn)
+        start_page, seen_ids, changed = 1, [], 0
+    # An empty store needs every page too, so the first sync fetches them
+    # concurrently like a full one. Kept in the checkpoint, because a resumed
+    # first sync finds the items it already stored.
+    walk_all = state['walk_all'] if state else full or latest is None
+    logger.info(f"Syncing collection store ({'full' if walk_all else f'since {latest}'}"
+                f"{f', from page {start_page}' if start_page > 1 else ''})")
+    
+    request_stats = {'page_requests': 0, 'enrich_requests': 0}
+    
+    # Only a walk that got through the last page can tell what was removed
+    reached_end = False
+    for page, payload in iter_sync_pages(d, walk_all, request_stats, start_page):
+        if not payload:
+            break
+        reached_end = page >= payload['pagination']['pages']
+        if not payload['releases']:
+            break
+        
+        batch = []
+        done = False
+        for item in payload['releases']:
+            # Seen even if it fails to parse, so pruning never drops it
+            seen_ids.append(item['instance_id'])
+            try:
+                release_data = build_release_data(item)
+            except Exception as e:
+                logger.error(f"Error processing item: {str(e)}")
                 continue
-            elif e.status_code == 404:  # Page not found - we've reached the end
-                logger.debug("Reached the last page")
+            if latest and release_data['date_added'] < latest and collection_store.has_instance(conn, item['instance_id']):
+                done = True
                 break
-            else:
-                raise
+            if enrich and needs_enrichment(release_data):
+                enrich_release_data(d, release_data, request_stats)
+            batch.append(release_data)
+        
+        changed += collection_store.upsert_items(conn, batch)
+        conn.commit()
+        if done:
+            break
+        checkpoint.save(checkpoint_name, {'latest': latest, 'walk_all': walk_all, 'page': page,
+                                          'seen_ids': seen_ids, 'changed': changed}, checkpoint_params)
+    
+    if full and reached_end:
+        removed = collection_store.delete_missing(conn, seen_ids)
+        logger.info(f"Removed {removed} items no longer in the collection")
+    elif full:
+        logger.warning("Full sync stopped before the last page; not removing any items")
     
-    logger.info(f"Found {len(items)} items from {year}")
+    collection_store.set_meta(conn, 'last_sync', datetime.now().isoformat())
+    conn.commit()
+    checkpoint.clear(checkpoint_name)
+    metrics.count('discogs.page_requests', request_stats['page_requests'])
+    metrics.count('discogs.enrich_requests', request_stats['enrich_requests'])
+    logger.info(f"Synced {changed} new or changed items ({collection_store.count_items(conn)} stored, "
+                f"{request_stats['page_requests']} page requests, "
+                f"{request_stats['enrich_requests']} release lookups)")
+    return changed
+
+def iter_collection_from_store(conn, year):
+    """Yield the year's collection items from the local store"""
+    with metrics.stage('russ_fm'):
+        image_lookup = load_image_lookup()
+    for item in collection_store.iter_year(conn, year):
+        yield add_image_data(item, image_lookup)
+
+def load_collection_from_store(conn, year):
+    """Build the year's collection items from the local store"""
+    items = list(iter_collection_from_store(conn, year))
+    logger.info(f"Found {len(items)} items from {year} in the local store")
     return items
 
+def sync_store(full_sync=False, enrich=False, resume=False):
+    """Sync the local collection store once, e.g. before exporting several years"""
+    conn = collection_store.open_store()
+    try:
+        return sync_collection(conn, full=full_sync, enrich=enrich, resume=resume)
+    finally:
+        conn.close()
+
 def save_collection(items, output_file):
-    """Save collection to JSON file"""
-    with open(output_file, 'w', encoding='utf-8') as f:
-        json.dump(items, f, indent=2, ensure_ascii=False)
-    logger.info(f"Saved {len(items)} items to {output_file}")
+    """Save collection to a .json, .ndjson or .ndjson.gz file"""
+    count = collection_io.save_collection(items, output_file)
+    logger.info(f"Saved {count} items to {output_file}")
 
-def main(year=None, output_file=None):
-    """Main function to fetch and save collection data"""
+def main(year=None, output_file=None, use_store=True, full_sync=False, enrich=False, sync=True, resume=False):
+    """Main function to fetch and save collection data.
+
+    Items are streamed into output_file as they are read, in the format
+    its extension names (NDJSON by default). With sync=False the year is
+    exported from the local store as it is, for callers that have already
+    synced it. With resume=True an interrupted fetch continues from its
+    checkpoint. Returns the number of items saved.
+    """
     if year is None:
         year = datetime.now().year
     if output_file is None:
-        output_file = f"collection_{year}.json"
+        output_file = collection_io.collection_path('', year)
     
     print(f"Fetching {year} collection for user: {USERNAME}")
-    items = fetch_collection(year)
-    save_collection(items, output_file)
-    print(f"Successfully saved {len(items)} items to {output_file}")
+    with collection_io.CollectionWriter(output_file) as writer:
+        if use_store:
+            conn = collection_store.open_store()
+            try:
+                if sync:
+                    sync_collection(conn, full=full_sync, enrich=enrich, resume=resume)
+                writer.write_all(iter_collection_from_store(conn, year))
+            finally:
+                conn.close()
+        else:
+            writer.write_all(iter_fetch_collection(year, enrich=enrich, resume=resume))
+    print(f"Successfully saved {writer.count} items to {output_file}")
     
-    return items
+    return writer.count
 
 if __name__ == "__main__":
+    logging.basicConfig(level=log_level)
     main()
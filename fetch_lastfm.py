@@ -3,17 +3,32 @@
 import os
 import json
 from datetime import datetime
-import pylast
 from dotenv import load_dotenv
-from collections import Counter
 import logging
+from concurrent.futures import ThreadPoolExecutor, as_completed
+import checkpoint
+import http_client
+import metrics
+import scrobble_store
+
+load_dotenv()
 
-# Set up logging
-logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+LASTFM_API_URL = os.getenv('LASTFM_API_URL', 'https://ws.audioscrobbler.com/2.0/')
+PAGE_SIZE = 200  # Largest page the recent tracks API allows
+MAX_RETRIES = 3
+CONCURRENCY = int(os.getenv('LASTFM_CONCURRENCY', '4'))  # windows fetched in parallel
+# Scrobbles are stamped with the time a track started and can be submitted
+# hours later (offline and mobile players), so the most recent stretch is
+# never marked as fetched and is asked for again on the next sync
+LATE_SCROBBLE_GRACE = 6 * 3600
+
+# Last.fm asks for no more than 5 requests a second
+rate_limiter = http_client.RateLimiter(limit=5, window=1.0, name='lastfm')
+
 def get_lastfm_client():
-    """Initialize and return Last.fm client"""
+    """Return the Last.fm API key and username"""
     load_dotenv()
     
     api_key = os.getenv('LASTFM_API_KEY')
@@ -22,45 +37,192 @@ def get_lastfm_client():
     if not api_key or not username:
         raise ValueError("Please set LASTFM_API_KEY and LASTFM_USERNAME in your .env file")
     
-    return pylast.LastFMNetwork(api_key=api_key), username
+    return api_key, username
 
-def fetch_lastfm_data(year):
-    """Fetch Last.fm data for a specific year"""
-    try:
-        network, username = get_lastfm_client()
-        user = network.get_user(username)
-        
-        # Get all tracks for the year
-        from_date = int(datetime(year, 1, 1).timestamp())
-        to_date = int(datetime(year, 12, 31, 23, 59, 59).timestamp())
-        
-        logger.info(f"Fetching scrobbles from {datetime.fromtimestamp(from_date)} to {datetime.fromtimestamp(to_date)}")
-        
-        # Get recent tracks with the from/to timestamps
-        tracks = user.get_recent_tracks(limit=None, time_from=from_date, time_to=to_date)
-        
-        # Process track data
-        artists = Counter()
-        albums = Counter()
-        total_scrobbles = 0
+def iter_recent_pages(api_key, username, time_from, time_to):
+    """Yield a list of (ts, artist, album, track) rows per page of a time range.
+    
+    Pages through user.getRecentTracks, newest first, skipping the
+    "now playing" entry which has no timestamp yet.
+    """
+    page = 1
+    while True:
+        response = http_client.request_with_retries('GET', LASTFM_API_URL, limiter=rate_limiter, params={
+            'method': 'user.getrecenttracks',
+            'user': username,
+            'api_key': api_key,
+            'from': time_from,
+            'to': time_to,
+            'limit': PAGE_SIZE,
+            'page': page,
+            'format': 'json'
+        })
+        response.raise_for_status()
+        recent = response.json()['recenttracks']
         
-        logger.info("Processing scrobbles...")
-        for track in tracks:
-            artists[track.track.artist.name] += 1
-            # Some tracks might not have album info
-            if track.album:
-                albums[f"{track.track.artist.name} - {track.album}"] += 1
-            total_scrobbles += 1
+        tracks = recent.get('track', [])
+        if isinstance(tracks, dict):
+            tracks = [tracks]
+        yield [
+            (
+                int(track['date']['uts']),
+                track['artist']['#text'],
+                track.get('album', {}).get('#text', ''),
+                track['name']
+            )
+            for track in tracks if 'date' in track
+        ]
         
-        logger.info(f"Processed {total_scrobbles} scrobbles")
+        total_pages = int(recent.get('@attr', {}).get('totalPages', 0))
+        logger.debug(f"Fetched scrobbles page {page} of {total_pages}")
+        if page >= total_pages:
+            break
+        page += 1
+
+def split_windows(start_ts, end_ts):
+    """Split a time range into calendar-month windows"""
+    windows = []
+    window_start = start_ts
+    while window_start <= end_ts:
+        start = datetime.fromtimestamp(window_start)
+        if start.month == 12:
+            next_month = datetime(start.year + 1, 1, 1)
+        else:
+            next_month = datetime(start.year, start.month + 1, 1)
+        window_end = min(end_ts, int(next_month.timestamp()) - 1)
+        windows.append((window_start, window_end))
+        window_start = window_end + 1
+    return windows
+
+def window_checkpoint(username, window):
+    return f"lastfm-{username}-{window[0]}-{window[1]}"
+
+def fetch_window(api_key, username, window, resume=False):
+    """Fetch every scrobble in one window, continuing from the last page on failure.
+    
+    Each page's scrobbles are saved once as a checkpoint part, and the
+    checkpoint itself only holds the oldest timestamp seen and the number
+    of parts. Retries, and with resume=True later runs, only ask for the
+    part of the window older than that cursor. The checkpoint is cleared by
+    the caller once the scrobbles are stored.
+    """
+    name = window_checkpoint(username, window)
+    state = checkpoint.resume_state(name, resume=resume) or {'cursor': None, 'parts': 0}
+    scrobbles = []
+    for part in range(state['parts']):
+        scrobbles.extend(tuple(row) for row in checkpoint.load_part(name, part) or [])
+    cursor, parts = state['cursor'], state['parts']
+    for attempt in range(MAX_RETRIES):
+        # Scrobbles sharing the cursor's second may sit on the next page, so
+        # the range overlaps it by one second; duplicates are ignored on insert
+        time_to = window[1] if cursor is None else min(window[1], cursor + 1)
+        try:
+            for rows in iter_recent_pages(api_key, username, window[0], time_to):
+                if not rows:
+                    continue
+                scrobbles.extend(rows)
+                oldest = min(row[0] for row in rows)
+                cursor = oldest if cursor is None else min(cursor, oldest)
+                checkpoint.save_part(name, parts, rows)
+                parts += 1
+                checkpoint.save(name, {'cursor': cursor, 'parts': parts})
+            return scrobbles
+        except Exception as e:
+            if attempt == MAX_RETRIES - 1:
+                raise
+            logger.warning(f"Retrying window starting {datetime.fromtimestamp(window[0])}"
+                           f"{f' from {datetime.fromtimestamp(cursor)}' if cursor else ''}: {str(e)}")
+
+def sync_scrobbles(conn, start_ts, end_ts, concurrency=None, resume=False):
+    """Fetch any scrobbles in [start_ts, end_ts] that are not stored yet.
+    
+    Missing ranges are split into month windows fetched in parallel. Each
+    window is written and marked as fetched as soon as it completes, so
+    after a failure only the unfinished windows are fetched again, and with
+    resume=True those continue from their page checkpoints. The store
+    remembers fetched ranges, so a refresh only asks Last.fm for scrobbles
+    newer than the last sync. Ranges are only marked as fetched up to
+    LATE_SCROBBLE_GRACE before now, so late submissions are picked up by a
+    later sync; scrobbles fetched twice are ignored on insert.
+    """
+    if concurrency is None:
+        concurrency = CONCURRENCY
+    now = int(datetime.now().timestamp())
+    end_ts = min(end_ts, now)
+    settled_ts = now - LATE_SCROBBLE_GRACE
+    
+    windows = [
+        window
+        for gap in scrobble_store.missing_ranges(conn, start_ts, end_ts)
+        for window in split_windows(*gap)
+    ]
+    metrics.count('lastfm.windows_fetched', len(windows))
+    if not windows:
+        logger.info("Scrobble store is up to date")
+        return 0
+    # Only needed once there is something to fetch, so a stored year can be
+    # summarized without credentials
+    api_key, username = get_lastfm_client()
+    logger.info(f"Fetching scrobbles from {datetime.fromtimestamp(windows[0][0])} "
+                f"to {datetime.fromtimestamp(windows[-1][1])} in {len(windows)} windows")
+    
+    added = 0
+    failed = []
+    # SQLite connections stay on this thread; workers only fetch
+    with ThreadPoolExecutor(max_workers=max(1, concurrency)) as executor:
+        futures = {executor.submit(fetch_window, api_key, username, window, resume): window for window in windows}
+        for future in as_completed(futures):
+            window = futures[future]
+            try:
+                scrobbles = future.result()
+            except Exception as e:
+                logger.error(f"Failed to fetch window starting {datetime.fromtimestamp(window[0])}: {str(e)}")
+                failed.append(window)
+                continue
+            added += scrobble_store.append_scrobbles(conn, scrobbles)
+            if window[0] <= settled_ts:
+                scrobble_store.mark_fetched(conn, window[0], min(window[1], settled_ts))
+            conn.commit()
+            checkpoint.clear(window_checkpoint(username, window))
+    
+    logger.info(f"Stored {added} new scrobbles")
+    if failed:
+        raise RuntimeError(f"{len(failed)} of {len(windows)} scrobble windows failed; "
+                           f"re-run with --resume to fetch the rest of them")
+    return added
+
+def summarize_scrobbles(conn, start_ts, end_ts, year=None, limit=10):
+    """Build the Last.fm summary for a date range from the local store"""
+    return {
+        'top_artists': scrobble_store.top_artists(conn, start_ts, end_ts, limit),
+        'top_albums': scrobble_store.top_albums(conn, start_ts, end_ts, limit),
+        'total_scrobbles': scrobble_store.count_scrobbles(conn, start_ts, end_ts),
+        'fetched_at': datetime.now().isoformat(),
+        'year': year
+    }
+
+def year_range(year):
+    """Return the first and last timestamps of a year"""
+    return int(datetime(year, 1, 1).timestamp()), int(datetime(year, 12, 31, 23, 59, 59).timestamp())
+
+def fetch_lastfm_data(year, resume=False):
+    """Fetch Last.fm data for a specific year.
+    
+    New scrobbles are synced into the local store first, then the summary
+    is derived from the store.
+    """
+    try:
+        from_date, to_date = year_range(year)
+        conn = scrobble_store.open_store()
+        try:
+            sync_scrobbles(conn, from_date, to_date, resume=resume)
+            logger.info("Processing scrobbles...")
+            data = summarize_scrobbles(conn, from_date, to_date, year)
+        finally:
+            conn.close()
         
-        return {
-            'top_artists': artists.most_common(10),
-            'top_albums': albums.most_common(10),
-            'total_scrobbles': total_scrobbles,
-            'fetched_at': datetime.now().isoformat(),
-            'year': year
-        }
+        logger.info(f"Processed {data['total_scrobbles']} scrobbles")
+        return data
     except Exception as e:
         logger.error(f"Error fetching Last.fm data: {str(e)}")
         return None
@@ -76,7 +238,7 @@ def load_lastfm_data(json_file):
     with open(json_file, 'r') as f:
         return json.load(f)
 
-def main(year=None, output_file=None, force=False):
+def main(year=None, output_file=None, force=False, resume=False):
     """Main function to fetch and save Last.fm data"""
     if year is None:
         year = datetime.now().year
@@ -84,13 +246,14 @@ def main(year=None, output_file=None, force=False):
         output_file = f"lastfm_{year}.json"
     
     # Check if data file exists and is not forced to refresh
+    metrics.cache_hit('lastfm_file', os.path.exists(output_file) and not force)
     if os.path.exists(output_file) and not force:
         logger.info(f"Using existing Last.fm data from {output_file}")
         return load_lastfm_data(output_file)
     
     # Fetch new data
     logger.info(f"Fetching Last.fm data for {year}...")
-    data = fetch_lastfm_data(year)
+    data = fetch_lastfm_data(year, resume=resume)
     
     if data:
         save_lastfm_data(data, output_file)
@@ -99,4 +262,5 @@ def main(year=None, output_file=None, force=False):
     return None
 
 if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
     main()
@@ -1,139 +1,291 @@
 from datetime import datetime
 from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+import heapq
 import json
+import re
+import unicodedata
 import os
 from pathlib import Path
-from jinja2 import Environment, FileSystemLoader
 import logging
+import collection_columns
+import collection_io
+import image_pipeline
+import metrics
+import render
+import rollup
+from build_manifest import atomic_open
 
-# Set up logging
-logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 def create_month_id(month):
     """Create a valid HTML ID from a month name"""
     return f"month-{month.lower().replace(' ', '-')}"
 
-def load_collection(json_file):
-    with open(json_file, 'r') as f:
-        return json.load(f)
+def load_collection(collection_file):
+    return collection_io.load_collection(collection_file)
 
-def analyze_collection(data, year=None):
+MONTHS = ['January', 'February', 'March', 'April', 'May', 'June', 
+          'July', 'August', 'September', 'October', 'November', 'December']
+RECENT_ADDITIONS = 10
+TOP_ARTISTS = 12
+SHARD_DIR = 'months'
+INLINE_MONTHS = 1  # months rendered into the page in sharded mode; the rest load on demand
+DISAMBIGUATION_RE = re.compile(r'\s*\(\d+\)$')
+PUNCTUATION_RE = re.compile(r'[^\w\s]')
+
+def date_added_key(item):
+    return item['date_added']
+
+def card_record(item):
+    """Copy the fields the report needs from a record.
+
+    Record cards, Last.fm matching and image localizing only read these,
+    so the aggregator holds a few fields per record rather than every
+    parsed record, and a streamed collection never sits in memory whole.
+    """
+    return {
+        'title': item['title'],
+        'artist': item.get('artist', []),
+        'album_uri': item['album_uri'],
+        'artist_uri': item['artist_uri'],
+        'cover_image': item.get('cover_image'),
+        'artist_image': item.get('artist_image'),
+        'formats': item['formats'][:1],
+        'date_added': item['date_added']
+    }
+
+class CollectionStats:
+    """Single-pass, mergeable collection aggregator.
+
+    add() parses each record once and updates every counter together.
+    Partial results for chunks (or years) can be combined with merge() as
+    long as they are merged in the same order the records came in, which
+    keeps tie-breaking identical to a single pass over all records.
+    """
+
+    def __init__(self):
+        self.total_records = 0
+        self.monthly_adds = Counter()
+        self.genres = Counter()
+        self.styles = Counter()
+        self.formats = Counter()
+        self.labels = Counter()
+        self.records_by_month = {}
+        self.artist_counts = {}
+        # Artist cards only link to their first record
+        self.artist_records = {}
+        self.artist_images = {}
+        self.recent_additions = []
+
+    def add(self, item):
+        # Skip records without russ.fm URLs
+        if item['album_uri'] is None or item['artist_uri'] is None:
+            return
+        
+        self.total_records += 1
+        card = card_record(item)
+        month = datetime.fromisoformat(item['date_added']).strftime('%B')
+        self.monthly_adds[month] += 1
+        self.records_by_month.setdefault(month, []).append(card)
+        
+        self.genres.update(item['genres'])
+        self.styles.update(item.get('styles', []))
+        for format_info in item['formats']:
+            self.formats[f"{format_info['name']} ({', '.join(format_info['descriptions'])})"] += 1
+        self.labels.update(item['labels'])
+        
+        artists = item.get('artist', [])
+        if isinstance(artists, str):
+            artists = [artists]
+        artist_key = ' & '.join(artists) if len(artists) > 1 else artists[0]
+        if artist_key not in self.artist_counts:
+            self.artist_counts[artist_key] = 0
+            self.artist_records[artist_key] = card
+            # Use the first artist's image for combined artists
+            self.artist_images[artist_key] = item.get('artist_image', '')
+        self.artist_counts[artist_key] += 1
+        
+        self.recent_additions.append(card)
+        if len(self.recent_additions) > 4 * RECENT_ADDITIONS:
+            self._trim_recent()
+
+    def _trim_recent(self):
+        self.recent_additions = heapq.nlargest(RECENT_ADDITIONS, self.recent_additions, key=date_added_key)
+
+    def update(self, items):
+        for item in items:
+            self.add(item)
+        return self
+
+    def merge(self, other):
+        """Fold in stats for records that came after ours"""
+        self.total_records += other.total_records
+        self.monthly_adds.update(other.monthly_adds)
+        self.genres.update(other.genres)
+        self.styles.update(other.styles)
+        self.formats.update(other.formats)
+        self.labels.update(other.labels)
+        for month, records in other.records_by_month.items():
+            self.records_by_month.setdefault(month, []).extend(records)
+        for artist_key, count in other.artist_counts.items():
+            if artist_key not in self.artist_counts:
+                self.artist_counts[artist_key] = 0
+                self.artist_records[artist_key] = other.artist_records[artist_key]
+                self.artist_images[artist_key] = other.artist_images[artist_key]
+            self.artist_counts[artist_key] += count
+        self.recent_additions.extend(other.recent_additions)
+        self._trim_recent()
+        return self
+
+    def result(self, year):
+        """Build the stats dict used by the report template"""
+        # Sort each month's records by date; months come out in date order
+        records_by_month = {}
+        for month, records in sorted(self.records_by_month.items(),
+                                     key=lambda entry: min(map(date_added_key, entry[1]))):
+            records_by_month[month] = sorted(records, key=date_added_key)
+        
+        # Prepare top artists data
+        top_artists_data = []
+        for artist, count in sorted(self.artist_counts.items(), key=lambda x: x[1], reverse=True):
+            if artist.lower() != "various":  # Skip 'Various' artists
+                top_artists_data.append({
+                    'name': artist,
+                    'count': count,
+                    'image': self.artist_images[artist],
+                    'records': [self.artist_records[artist]]
+                })
+                if len(top_artists_data) == TOP_ARTISTS:  # Only take top 12 non-Various artists
+                    break
+        
+        return {
+            'total_records': self.total_records,
+            'monthly_adds': dict(self.monthly_adds),
+            'top_genres': dict(self.genres.most_common(5)),
+            'top_styles': dict(self.styles.most_common(5)),
+            'top_formats': dict(self.formats.most_common(5)),
+            'top_labels': dict(self.labels.most_common(5)),
+            'monthly_data': [self.monthly_adds[month] for month in MONTHS],
+            'months': MONTHS,
+            'month_ids': {month: create_month_id(month) for month in MONTHS},
+            'records_by_month': records_by_month,
+            'top_artists': top_artists_data,
+            'recent_additions': heapq.nlargest(RECENT_ADDITIONS, self.recent_additions, key=date_added_key),
+            'year': year,
+            'genres': dict(self.genres),
+            'styles': dict(self.styles),
+            'formats': dict(self.formats),
+            'labels': dict(self.labels),
+            'artists': dict(self.artist_counts)
+        }
+
+def _stats_for_chunk(chunk):
+    return CollectionStats().update(chunk)
+
+def analyze_collection(data, year=None, workers=1):
+    """Analyze collection records in a single pass.
+
+    data is an iterable of record dicts (such as a generator streaming
+    them from disk) or a ColumnarCollection, which is analyzed with
+    vectorized group-bys instead. With workers > 1 records are split into
+    contiguous chunks that are aggregated in a process pool and merged back
+    in order.
+    """
     # Use provided year or current year as fallback
     if year is None:
         year = datetime.now().year
-        
-    # Filter out records without russ.fm URLs
-    data = [record for record in data if record['album_uri'] is not None and record['artist_uri'] is not None]
     
-    total_records = len(data)
+    if isinstance(data, collection_columns.ColumnarCollection):
+        return collection_columns.analyze_columnar(data, year, recent_additions=RECENT_ADDITIONS,
+                                                   top_artists=TOP_ARTISTS)
     
-    # Sort all records by date
-    sorted_records = sorted(data, key=lambda x: x['date_added'])
+    if workers > 1 and not isinstance(data, list):
+        data = list(data)
+    if workers > 1 and len(data) > workers:
+        chunk_size = -(-len(data) // workers)
+        chunks = [data[i:i + chunk_size] for i in range(0, len(data), chunk_size)]
+        stats = CollectionStats()
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            for partial in executor.map(_stats_for_chunk, chunks):
+                stats.merge(partial)
+    else:
+        stats = CollectionStats().update(data)
     
-    # Count by month
-    monthly_adds = Counter()
-    for item in data:
-        date_added = datetime.fromisoformat(item['date_added'])
-        monthly_adds[date_added.strftime('%B')] += 1
+    return stats.result(year)
+
+def normalize_name(name):
+    """Normalize an artist or album name for matching across Discogs and Last.fm.
+
+    Ignores case, accents, punctuation, "&" vs "and", a leading (or Discogs
+    style trailing) "The" and Discogs' "(2)" disambiguation suffixes.
+    """
+    name = unicodedata.normalize('NFKD', name)
+    name = ''.join(char for char in name if not unicodedata.combining(char)).casefold()
+    name = DISAMBIGUATION_RE.sub('', name)
+    name = name.replace('&', ' and ')
+    name = PUNCTUATION_RE.sub(' ', name)
+    words = name.split()
+    if words and words[0] == 'the':
+        words = words[1:]
+    elif len(words) > 1 and words[-1] == 'the':
+        words = words[:-1]
+    return ' '.join(words)
+
+def build_lastfm_index(lastfm_data):
+    """Build normalized artist and (artist, album) -> scrobble count lookups"""
+    artist_index = {}
+    for artist, count in lastfm_data.get('top_artists', []):
+        key = normalize_name(artist)
+        artist_index[key] = artist_index.get(key, 0) + count
     
-    # Most common genres and styles
-    genres = Counter()
-    styles = Counter()
+    album_index = {}
+    for album, count in lastfm_data.get('top_albums', []):
+        # Entries are "artist - album" and either side may contain " - ",
+        # so index every possible split
+        parts = album.split(' - ')
+        for i in range(1, len(parts)):
+            key = (normalize_name(' - '.join(parts[:i])), normalize_name(' - '.join(parts[i:])))
+            album_index[key] = album_index.get(key, 0) + count
     
-    for item in data:
-        for genre in item['genres']:
-            genres[genre] += 1
-        for style in item.get('styles', []):
-            styles[style] += 1
+    return artist_index, album_index
+
+def artist_name_variants(artists):
+    """Normalized names a record's artists might be scrobbled under"""
+    if isinstance(artists, str):
+        artists = [artists]
+    variants = [normalize_name(' & '.join(artists))]
+    variants.extend(normalize_name(artist) for artist in artists)
+    return list(dict.fromkeys(variants))
+
+def attach_lastfm_counts(stats, lastfm_data):
+    """Attach scrobble counts to top artists and records before rendering.
+
+    Each lookup is a dict hit, so matching costs O(1) per card no matter
+    how many Last.fm entries there are.
+    """
+    artist_index, album_index = build_lastfm_index(lastfm_data)
     
-    # Format analysis
-    formats = Counter()
-    for item in data:
-        for format_info in item['formats']:
-            format_desc = f"{format_info['name']} ({', '.join(format_info['descriptions'])})"
-            formats[format_desc] += 1
-    
-    # Labels analysis
-    labels = Counter()
-    for item in data:
-        for label in item['labels']:
-            labels[label] += 1
-    
-    # Records by month (for chart)
-    months_order = ['January', 'February', 'March', 'April', 'May', 'June', 
-                   'July', 'August', 'September', 'October', 'November', 'December']
-    monthly_data = [monthly_adds[month] for month in months_order]
-    
-    # Group records by month for display
-    records_by_month = {}
-    for item in sorted_records:
-        date_added = datetime.fromisoformat(item['date_added'])
-        month = date_added.strftime('%B')
-        if month not in records_by_month:
-            records_by_month[month] = []
-        records_by_month[month].append(item)
-    
-    # Create month IDs for linking
-    month_ids = {month: create_month_id(month) for month in months_order}
-    
-    # Get top artists with their record counts and images
-    artist_counts = {}
-    artist_records = {}
-    artist_images = {}
-    
-    for item in data:
-        artists = item.get('artist', [])
-        if isinstance(artists, str):
-            artists = [artists]
-        artist_key = ' & '.join(artists) if len(artists) > 1 else artists[0]
-        
-        if artist_key not in artist_counts:
-            artist_counts[artist_key] = 0
-            artist_records[artist_key] = []
-            # Use the first artist's image for combined artists
-            artist_images[artist_key] = item.get('artist_image', '')
-            
-        artist_counts[artist_key] += 1
-        artist_records[artist_key].append(item)
-    
-    # Prepare top artists data
-    top_artists_data = []
-    for artist, count in sorted(artist_counts.items(), key=lambda x: x[1], reverse=True):
-        if artist.lower() != "various":  # Skip 'Various' artists
-            top_artists_data.append({
-                'name': artist,
-                'count': count,
-                'image': artist_images[artist],
-                'records': artist_records[artist]
-            })
-            if len(top_artists_data) == 12:  # Only take top 12 non-Various artists
-                break
+    for artist in stats['top_artists']:
+        artist['scrobbles'] = next(
+            (artist_index[key] for key in artist_name_variants(artist['name'].split(' & ')) if key in artist_index),
+            None
+        )
     
-    return {
-        'total_records': total_records,
-        'monthly_adds': dict(monthly_adds),
-        'top_genres': dict(genres.most_common(5)),
-        'top_styles': dict(styles.most_common(5)),
-        'top_formats': dict(formats.most_common(5)),
-        'top_labels': dict(labels.most_common(5)),
-        'monthly_data': monthly_data,
-        'months': months_order,
-        'month_ids': month_ids,
-        'records_by_month': records_by_month,
-        'top_artists': top_artists_data,
-        'recent_additions': sorted(data, key=lambda x: x['date_added'], reverse=True)[:10],
-        'year': year,
-        'genres': dict(genres),
-        'styles': dict(styles),
-        'formats': dict(formats),
-        'labels': dict(labels),
-        'artists': artist_counts  # Use the new artist_counts dictionary
-    }
+    for records in stats['records_by_month'].values():
+        for record in records:
+            title = normalize_name(record['title'])
+            record['scrobbles'] = next(
+                (album_index[(key, title)] for key in artist_name_variants(record.get('artist', []))
+                 if (key, title) in album_index),
+                None
+            )
+    return stats
 
-def generate_html(stats, lastfm_data=None, template_dir='templates'):
-    env = Environment(loader=FileSystemLoader(template_dir))
-    template = env.get_template('report.html')
+def report_context(stats, lastfm_data=None):
+    """Build the template context for a year report"""
+    if lastfm_data:
+        attach_lastfm_counts(stats, lastfm_data)
     
     # Check for existence of adjacent year folders
     current_year = stats['year']
@@ -141,15 +293,59 @@ def generate_html(stats, lastfm_data=None, template_dir='templates'):
     prev_year_exists = (unwrapped_dir / str(current_year - 1)).exists()
     next_year_exists = (unwrapped_dir / str(current_year + 1)).exists()
     
-    return template.render(
-        stats=stats,
-        lastfm_data=lastfm_data,
-        current_year=current_year,
-        prev_year_exists=prev_year_exists,
-        next_year_exists=next_year_exists
-    )
+    return {
+        'stats': stats,
+        'lastfm_data': lastfm_data,
+        'current_year': current_year,
+        'prev_year_exists': prev_year_exists,
+        'next_year_exists': next_year_exists,
+        'image_sizes': image_pipeline.IMAGE_SIZES,
+        'month_shards': {},
+        'assets': {},
+        'static_prefix': '../'
+    }
+
+def shard_record(record):
+    """Reduce a record to the fields its month card needs"""
+    artists = record.get('artist', [])
+    return {
+        'title': record['title'],
+        'artist': [artists] if isinstance(artists, str) else artists,
+        'album_uri': record['album_uri'],
+        'image': record.get('cover_src') or record['cover_image'],
+        'srcset': record.get('cover_srcset'),
+        'format': record['formats'][0]['name'] if record['formats'] else None,
+        'scrobbles': record.get('scrobbles')
+    }
 
-def main(year=None, output_path=None, lastfm_data=None):
+def write_month_shards(stats, output_path):
+    """Write the records of each month after the first INLINE_MONTHS to a JSON shard.
+
+    Returns month -> shard URL relative to the report, for the template.
+    Shards left over from an earlier build are removed.
+    """
+    shard_dir = os.path.join(output_path, SHARD_DIR)
+    os.makedirs(shard_dir, exist_ok=True)
+    
+    shards = {}
+    for month, records in list(stats['records_by_month'].items())[INLINE_MONTHS:]:
+        name = f"{month.lower()}.json"
+        with atomic_open(os.path.join(shard_dir, name)) as f:
+            json.dump([shard_record(record) for record in records], f,
+                      separators=(',', ':'), ensure_ascii=False)
+        shards[month] = f"{SHARD_DIR}/{name}"
+    
+    written = {os.path.basename(url) for url in shards.values()}
+    for name in os.listdir(shard_dir):
+        if name.endswith('.json') and name not in written:
+            os.remove(os.path.join(shard_dir, name))
+    return shards
+
+def generate_html(stats, lastfm_data=None, template_dir='templates'):
+    return render.render('report.html', template_dir, **report_context(stats, lastfm_data))
+
+def main(year=None, output_path=None, lastfm_data=None, columnar=False, stream=False, local_images=False,
+         sharded=False, assets=None, offline=False, collection_file=None, workers=1):
     # Use current directory if no output path provided
     if output_path is None:
         output_path = os.getcwd()
@@ -157,28 +353,59 @@ def main(year=None, output_path=None, lastfm_data=None):
     # Ensure output directory exists
     os.makedirs(output_path, exist_ok=True)
     
-    # Load and analyze collection from main directory
-    base_dir = os.path.dirname(os.path.abspath(__file__))
-    collection_file = os.path.join(base_dir, f'collection_{year}.json')
+    # Load and analyze collection from main directory, in whichever format it was saved
+    if collection_file is None:
+        base_dir = os.path.dirname(os.path.abspath(__file__))
+        collection_file = (collection_io.find_collection_file(base_dir, year)
+                           or collection_io.collection_path(base_dir, year, 'json'))
     
+    # Records stream from the file straight into the aggregation
     logger.info(f"Loading collection from {collection_file}")
-    collection = load_collection(collection_file)
-    stats = analyze_collection(collection, year)
+    collection = collection_io.iter_collection(collection_file)
+    with metrics.stage('analyze'):
+        if columnar:
+            if collection_columns.load_numpy() is None:
+                logger.warning("NumPy is not installed, using the standard analysis")
+            else:
+                collection = collection_columns.ColumnarCollection(collection)
+        stats = analyze_collection(collection, year, workers=workers)
+    
+    # Serve images from local, resized copies shared by every year
+    if local_images:
+        images_dir = os.path.join(os.path.dirname(os.path.abspath(output_path)), 'images')
+        with metrics.stage('images'):
+            image_pipeline.localize_images(stats, images_dir, offline=offline)
     
     # Log Last.fm data status
     logger.info(f"Generating report with Last.fm data: {lastfm_data is not None}")
     if lastfm_data:
         logger.info(f"Last.fm data includes {lastfm_data['total_scrobbles']} scrobbles")
     
-    # Generate HTML
-    html_content = generate_html(stats, lastfm_data, template_dir=os.path.join(os.path.dirname(__file__), 'templates'))
+    context = report_context(stats, lastfm_data)
+    
+    # Keep a compact summary of the year for the all-time report and index charts
+    rollup.write_rollup(rollup.build_rollup(stats, lastfm_data), output_path)
+    if assets:
+        context['assets'] = assets
+    
+    # Move later months out of the page into shards fetched as they scroll into view
+    if sharded:
+        with metrics.stage('shards'):
+            context['month_shards'] = write_month_shards(stats, output_path)
+        logger.info(f"Wrote {len(context['month_shards'])} month shards")
     
-    # Write HTML file
+    # Generate and write HTML
     output_file = os.path.join(output_path, 'index.html')
-    with open(output_file, 'w') as f:
-        f.write(html_content)
+    with metrics.stage('render'):
+        render.render_to_file(
+            'report.html', output_file,
+            template_dir=os.path.join(os.path.dirname(__file__), 'templates'),
+            stream=stream,
+            **context
+        )
     
     logger.info(f"Report generated: {output_file}")
 
 if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
     main()
@@ -1,33 +1,99 @@
 #!/usr/bin/env python3
 
 import argparse
+import cProfile
+import pstats
 from datetime import datetime
+import json
 import os
-import fetch_collection
-import fetch_lastfm
+import re
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import collection_io
+import collection_store
 import generate_report
-import shutil
+import image_pipeline
 import logging
-from jinja2 import Environment, FileSystemLoader
+import build_manifest
+import metrics
+import publish
+import render
+import rollup
 
-# Set up logging
-logging.basicConfig(
-    level=logging.DEBUG,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
-)
+# fetch_collection and fetch_lastfm pull in the HTTP clients, so they are
+# only imported once a fetch is actually needed
 logger = logging.getLogger(__name__)
+LOG_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
 
-def parse_args():
-    parser = argparse.ArgumentParser(description='Generate Vinyl Unwrapped report for a specific year')
+STATIC_FILES = [os.path.join('css', 'style.css'), os.path.join('js', 'charts.js'), os.path.join('js', 'months.js')]
+COLLECTION_FILE_RE = re.compile(r'^collection_(\d{4})\.(json|ndjson|ndjson\.gz)$')
+ALLTIME_DIR = 'alltime'
+
+# Hand-written descriptions; other years get a generic one
+YEAR_DESCRIPTIONS = {
+    2024: "Explore my vinyl journey through 2024",
+    2023: "Revisit the records of 2023",
+    2022: "Look back at 2022's collection",
+    2021: "Discover the vinyl from 2021",
+    2020: "Remember the music of 2020",
+    2019: "Relive 2019's additions",
+    2018: "Explore the sounds of 2018",
+    2017: "Journey back to 2017",
+    2016: "Revisit 2016's collection",
+    2015: "Where it all began"
+}
+
+def build_parser(description='Generate Vinyl Unwrapped report for a specific year'):
+    parser = argparse.ArgumentParser(description=description)
     parser.add_argument('--year', type=int, default=datetime.now().year,
                       help='Year to generate the report for (defaults to current year)')
+    parser.add_argument('--years',
+                      help='Comma separated years or ranges to generate, e.g. 2019,2021-2023')
+    parser.add_argument('--all', action='store_true',
+                      help='Generate every year found in the local collection data')
+    parser.add_argument('--jobs', type=int, default=os.cpu_count() or 1,
+                      help='Worker processes used to build several years (defaults to CPU count)')
     parser.add_argument('--lastfm', action='store_true',
                       help='Include Last.fm listening data in the report')
     parser.add_argument('--force', action='store_true',
                       help='Force regeneration of collection and Last.fm data')
-    return parser.parse_args()
+    parser.add_argument('--resume', action='store_true',
+                      help='Continue an interrupted Discogs or Last.fm fetch from its last checkpoint')
+    parser.add_argument('--offline', action='store_true',
+                      help='Render only from local collection and Last.fm files, without any network access')
+    parser.add_argument('--format', choices=sorted(collection_io.FORMATS), default=collection_io.DEFAULT_FORMAT,
+                      help=f'File format for fetched collections (defaults to {collection_io.DEFAULT_FORMAT}; '
+                           'existing files in any format are still used)')
+    parser.add_argument('--full-sync', action='store_true',
+                      help='Re-crawl the whole Discogs collection into the local store')
+    parser.add_argument('--no-store', action='store_true',
+                      help='Fetch the year directly from Discogs instead of using the local store')
+    parser.add_argument('--columnar', action='store_true',
+                      help='Analyze the collection with NumPy-backed columns (needs numpy)')
+    parser.add_argument('--analyze-workers', type=int, default=1,
+                      help='Processes used to analyze each year\'s collection; more than 1 loads it whole '
+                           '(defaults to 1)')
+    parser.add_argument('--stream', action='store_true',
+                      help='Stream the report to disk in chunks instead of rendering it in memory')
+    parser.add_argument('--sharded', action='store_true',
+                      help='Write each month\'s records to a JSON shard loaded as the page scrolls')
+    parser.add_argument('--local-images', action='store_true',
+                      help='Download cover and artist images and serve resized local copies')
+    parser.add_argument('--publish', action='store_true',
+                      help='Minify the output, fingerprint static files and write .gz/.br siblings')
+    parser.add_argument('--rebuild', action='store_true',
+                      help='Ignore the build manifest and rebuild every output')
+    parser.add_argument('--metrics',
+                      help='Write run metrics to this JSON file (defaults to .cache/metrics/run-<time>-<pid>.json)')
+    parser.add_argument('--profile', action='store_true',
+                      help='Run under cProfile and save the stats next to the metrics file')
+    parser.add_argument('--enrich', action='store_true',
+                      help='Look up full Discogs releases for records missing genres, styles or year')
+    return parser
 
-def setup_unwrapped_structure():
+def parse_args():
+    return build_parser().parse_args()
+
+def setup_unwrapped_structure(manifest):
     base_dir = os.path.dirname(os.path.abspath(__file__))
     unwrapped_dir = os.path.join(base_dir, 'unwrapped')
     
@@ -36,99 +102,318 @@ def setup_unwrapped_structure():
     os.makedirs(os.path.join(unwrapped_dir, 'css'), exist_ok=True)
     os.makedirs(os.path.join(unwrapped_dir, 'js'), exist_ok=True)
     
-    # Always copy static files to ensure we have the latest version
+    # Copy static files whenever their content has changed
     static_dir = os.path.join(base_dir, 'static')
     if os.path.exists(static_dir):
-        # Copy CSS files
-        if os.path.exists(os.path.join(static_dir, 'css', 'style.css')):
-            shutil.copy2(
-                os.path.join(static_dir, 'css', 'style.css'),
-                os.path.join(unwrapped_dir, 'css', 'style.css')
-            )
-            logger.info("Updated style.css in unwrapped directory")
-            
-        # Copy JS files
-        if os.path.exists(os.path.join(static_dir, 'js', 'charts.js')):
-            shutil.copy2(
-                os.path.join(static_dir, 'js', 'charts.js'),
-                os.path.join(unwrapped_dir, 'js', 'charts.js')
-            )
-            logger.info("Updated charts.js in unwrapped directory")
-
-def generate_index_html():
-    """Generate the main index.html file"""
-    env = Environment(loader=FileSystemLoader('templates'))
-    template = env.get_template('index.html')
-    
-    # Year descriptions
-    year_descriptions = {
-        2024: "Explore my vinyl journey through 2024",
-        2023: "Revisit the records of 2023",
-        2022: "Look back at 2022's collection",
-        2021: "Discover the vinyl from 2021",
-        2020: "Remember the music of 2020",
-        2019: "Relive 2019's additions",
-        2018: "Explore the sounds of 2018",
-        2017: "Journey back to 2017",
-        2016: "Revisit 2016's collection",
-        2015: "Where it all began"
-    }
+        for static_file in STATIC_FILES:
+            src = os.path.join(static_dir, static_file)
+            if os.path.exists(src) and build_manifest.copy_if_changed(
+                    src, os.path.join(unwrapped_dir, static_file), manifest):
+                logger.info(f"Updated {os.path.basename(static_file)} in unwrapped directory")
+
+def find_built_years():
+    """Years that have a built report in unwrapped/"""
+    return sorted(
+        int(name) for name in os.listdir('unwrapped')
+        if name.isdigit() and os.path.exists(os.path.join('unwrapped', name, 'index.html'))
+    )
+
+def rollup_files(years):
+    return [rollup.rollup_path(os.path.join('unwrapped', str(year))) for year in years]
+
+def generate_alltime_html(manifest, built_years):
+    """Generate the all-time report by merging the yearly rollups.
+
+    Only the small rollup files are read, never the collections, and the
+    page is only rebuilt when one of them has changed.
+    """
+    output_file = os.path.join('unwrapped', ALLTIME_DIR, 'index.html')
+    inputs_hash = build_manifest.hash_inputs(
+        rollup_files(built_years) + [os.path.join('templates', 'alltime.html')],
+        extra={'code': build_manifest.code_version(), 'years': built_years}
+    )
+    if build_manifest.is_up_to_date(manifest, output_file, inputs_hash):
+        logger.info(f"All-time report is up to date: {output_file}")
+        return
     
-    # Sort years in descending order
-    years = [(year, year_descriptions[year]) for year in sorted(year_descriptions.keys(), reverse=True)]
+    rollups = rollup.load_rollups('unwrapped', built_years)
+    if not rollups:
+        logger.info("No year rollups yet, skipping the all-time report")
+        return
     
-    # Generate HTML
-    html_content = template.render(years=years)
+    stats = rollup.merge_rollups(rollups)
+    render.render_to_file('alltime.html', output_file, template_dir='templates', stats=stats,
+                          image_sizes=image_pipeline.IMAGE_SIZES)
+    build_manifest.record(manifest, output_file, inputs_hash)
+    
+    logger.info(f"Generated all-time report for {len(rollups)} years: {output_file}")
+
+def generate_index_html(manifest, built_years):
+    """Generate the main index.html file if its inputs have changed.
+
+    Lists every year that has a built report in unwrapped/, with
+    year-over-year charts drawn from their rollups.
+    """
+    # Sort years in descending order
+    years = [(year, YEAR_DESCRIPTIONS.get(year, f"Revisit the records of {year}"))
+             for year in sorted(built_years, reverse=True)]
+    alltime = os.path.exists(os.path.join('unwrapped', ALLTIME_DIR, 'index.html'))
     
-    # Write to file
     output_file = os.path.join('unwrapped', 'index.html')
-    with open(output_file, 'w') as f:
-        f.write(html_content)
+    inputs_hash = build_manifest.hash_inputs(
+        rollup_files(built_years) + [os.path.join('templates', 'index.html')],
+        extra={'code': build_manifest.code_version(), 'years': years, 'alltime': alltime}
+    )
+    if build_manifest.is_up_to_date(manifest, output_file, inputs_hash):
+        logger.info(f"Index page is up to date: {output_file}")
+        return
+    
+    rollups = rollup.load_rollups('unwrapped', built_years)
+    series = rollup.yearly_series(rollups) if rollups else None
+    
+    # Generate HTML and write to file
+    render.render_to_file('index.html', output_file, template_dir='templates', years=years, series=series,
+                          alltime_dir=ALLTIME_DIR if alltime else None)
+    build_manifest.record(manifest, output_file, inputs_hash)
     
     logger.info(f"Generated index page: {output_file}")
 
-def main():
-    args = parse_args()
-    year = args.year
-    
-    # Create base directory structure
-    setup_unwrapped_structure()
+def parse_years(value):
+    """Parse a --years value such as "2019,2021-2023" into a sorted list"""
+    years = set()
+    for part in value.split(','):
+        part = part.strip()
+        if '-' in part:
+            start, end = part.split('-', 1)
+            years.update(range(int(start), int(end) + 1))
+        elif part:
+            years.add(int(part))
+    return sorted(years)
+
+def discover_years(base_dir):
+    """Find the years we have collection data for, locally"""
+    years = set()
+    for name in os.listdir(base_dir):
+        match = COLLECTION_FILE_RE.match(name)
+        if match:
+            years.add(int(match.group(1)))
+    if os.path.exists(collection_store.DEFAULT_DB):
+        conn = collection_store.open_store()
+        try:
+            years.update(collection_store.years(conn))
+        finally:
+            conn.close()
+    return sorted(years)
+
+def load_lastfm(year, lastfm_file, force=False, offline=False, resume=False):
+    """Load a year's Last.fm summary, only fetching (and importing the client) when needed"""
+    if os.path.exists(lastfm_file) and not force:
+        logger.info(f"Using existing Last.fm data from {lastfm_file}")
+        metrics.cache_hit('lastfm_file', True)
+        with open(lastfm_file, 'r') as f:
+            return json.load(f)
+    if offline:
+        logger.warning(f"No Last.fm data for {year} in {lastfm_file} (offline)")
+        return None
     
-    # Create year directory
+    import fetch_lastfm
+    return fetch_lastfm.main(year, lastfm_file, force, resume)
+
+def build_year(year, year_dir, collection_file, lastfm_data, columnar, stream, local_images, sharded, assets,
+               offline, analyze_workers=1):
+    """Analyze and render one year's report (runs in a worker process)"""
+    generate_report.main(year, year_dir, lastfm_data, columnar=columnar, stream=stream,
+                         local_images=local_images, sharded=sharded, assets=assets, offline=offline,
+                         collection_file=collection_file, workers=analyze_workers)
+    return year
+
+def build_year_job(*args):
+    """Build a year in a pool worker and return the metrics it recorded"""
+    metrics.reset()
+    build_year(*args)
+    return metrics.snapshot()
+
+def setup_logging():
+    level = logging.DEBUG if os.getenv('DEBUG', 'false').lower() == 'true' else logging.INFO
+    logging.basicConfig(level=level, format=LOG_FORMAT)
+
+def main(args=None):
+    if args is None:
+        args = parse_args()
+    setup_logging()
+    try:
+        run(args)
+    finally:
+        metrics.write(args.metrics)
+
+def run(args, years=None):
+    """Fetch whatever is missing and rebuild the outputs that are out of date.
+
+    years, when given, replaces --year/--years/--all, e.g. for the watcher.
+    """
     base_dir = os.path.dirname(os.path.abspath(__file__))
-    year_dir = os.path.join(base_dir, 'unwrapped', str(year))
-    os.makedirs(year_dir, exist_ok=True)
+    use_store = not args.no_store
+    if args.offline and args.force:
+        logger.warning("--force is ignored with --offline")
+        args.force = False
+    
+    # Outputs are only rebuilt when the hash of their inputs changes
+    manifest = {} if args.rebuild else build_manifest.load_manifest()
     
-    # Set collection file path
-    collection_file = os.path.join(base_dir, f'collection_{year}.json')
+    # Create base directory structure
+    with metrics.stage('static'):
+        setup_unwrapped_structure(manifest)
     
-    # Check if collection file exists
-    if os.path.exists(collection_file) and not args.force:
-        logger.info(f"Using existing collection file: {collection_file}")
+    # Publishing serves static files under content-hashed names
+    assets = {}
+    if args.publish:
+        with metrics.stage('static'):
+            assets = publish.fingerprint_static(os.path.join(base_dir, 'static'),
+                                                os.path.join(base_dir, 'unwrapped'), STATIC_FILES)
+    
+    # Sync the collection store once, up front, whenever anything needs fetching
+    synced = False
+    if years is not None:
+        years = sorted(years)
+    elif args.all:
+        if use_store and not args.offline and (args.force or not discover_years(base_dir)):
+            import fetch_collection
+            with metrics.stage('sync'):
+                fetch_collection.sync_store(full_sync=args.full_sync, enrich=args.enrich, resume=args.resume)
+            synced = True
+        years = discover_years(base_dir)
+    elif args.years:
+        years = parse_years(args.years)
     else:
-        # Fetch collection data
-        logger.info(f"Fetching collection data for {year}...")
-        fetch_collection.main(year, collection_file)
+        years = [args.year]
     
-    # Get Last.fm data if requested
-    lastfm_data = None
-    if args.lastfm:
+    existing_files = {year: collection_io.find_collection_file(base_dir, year) for year in years}
+    to_fetch = [year for year in years if args.force or existing_files[year] is None]
+    collection_files = {
+        year: collection_io.collection_path(base_dir, year, args.format) if year in to_fetch else existing_files[year]
+        for year in years
+    }
+    if args.offline and to_fetch:
+        logger.warning(f"Skipping {', '.join(map(str, to_fetch))}: no local collection file (offline)")
+        years = [year for year in years if year not in to_fetch]
+        to_fetch = []
+    if to_fetch:
+        import fetch_collection
+    if use_store and to_fetch and not synced:
+        with metrics.stage('sync'):
+            fetch_collection.sync_store(full_sync=args.full_sync, enrich=args.enrich, resume=args.resume)
+        synced = True
+    
+    for year in years:
+        if year in to_fetch:
+            # Fetch collection data
+            logger.info(f"Fetching collection data for {year}...")
+            with metrics.stage('collection'):
+                fetch_collection.main(year, collection_files[year],
+                                      use_store=use_store, full_sync=args.full_sync,
+                                      enrich=args.enrich, sync=not synced, resume=args.resume)
+        else:
+            logger.info(f"Using existing collection file: {collection_files[year]}")
+    
+    # Create year directories first so every report's year navigation is consistent
+    year_dirs = {year: os.path.join(base_dir, 'unwrapped', str(year)) for year in years}
+    for year_dir in year_dirs.values():
+        os.makedirs(year_dir, exist_ok=True)
+    
+    jobs = []
+    for year in years:
+        # Get Last.fm data if requested
+        lastfm_data = None
         lastfm_file = os.path.join(base_dir, f'lastfm_{year}.json')
-        lastfm_data = fetch_lastfm.main(year, lastfm_file, args.force)
+        if args.lastfm:
+            with metrics.stage('lastfm'):
+                lastfm_data = load_lastfm(year, lastfm_file, args.force, args.offline, args.resume)
+            if lastfm_data:
+                logger.info(f"Last.fm data loaded with {lastfm_data['total_scrobbles']} scrobbles")
+            else:
+                logger.warning("Failed to load Last.fm data")
+        
+        report_file = os.path.join(year_dirs[year], 'index.html')
+        report_inputs = [collection_files[year], os.path.join(base_dir, 'templates', 'report.html')]
         if lastfm_data:
-            logger.info(f"Last.fm data loaded with {lastfm_data['total_scrobbles']} scrobbles")
+            report_inputs.append(lastfm_file)
+        report_hash = build_manifest.hash_inputs(report_inputs, extra={
+            'code': build_manifest.code_version(),
+            'lastfm': lastfm_data is not None,
+            'local_images': args.local_images,
+            # Offline builds fall back to remote URLs for images not cached yet,
+            # so the next online build has to replace them
+            'offline_images': args.local_images and args.offline,
+            'sharded': args.sharded,
+            'assets': assets,
+            # The year navigation links depend on which neighbouring years exist
+            'prev_year_exists': os.path.exists(os.path.join(base_dir, 'unwrapped', str(year - 1))),
+            'next_year_exists': os.path.exists(os.path.join(base_dir, 'unwrapped', str(year + 1)))
+        })
+        # Reports built before rollups existed are rebuilt to produce one
+        if (build_manifest.is_up_to_date(manifest, report_file, report_hash)
+                and os.path.exists(rollup.rollup_path(year_dirs[year]))):
+            logger.info(f"Report for {year} is up to date")
         else:
-            logger.warning("Failed to load Last.fm data")
+            jobs.append((year, lastfm_data, report_file, report_hash))
+    
+    # Generate reports, in parallel when there is more than one
+    if len(jobs) > 1 and args.jobs > 1:
+        logger.info(f"Generating {len(jobs)} reports with {args.jobs} workers...")
+        with metrics.stage('reports'), ProcessPoolExecutor(max_workers=min(args.jobs, len(jobs))) as executor:
+            futures = {
+                executor.submit(build_year_job, year, year_dirs[year], collection_files[year], lastfm_data,
+                                args.columnar, args.stream, args.local_images, args.sharded, assets,
+                                args.offline, args.analyze_workers): (year, report_file, report_hash)
+                for year, lastfm_data, report_file, report_hash in jobs
+            }
+            for future in as_completed(futures):
+                year, report_file, report_hash = futures[future]
+                # Worker stages are summed across processes, so they can exceed the wall time
+                metrics.merge(future.result(), prefix='reports')
+                build_manifest.record(manifest, report_file, report_hash)
+    else:
+        for year, lastfm_data, report_file, report_hash in jobs:
+            logger.info(f"Generating report for {year}...")
+            logger.debug(f"Passing Last.fm data to report generator: {lastfm_data is not None}")
+            with metrics.stage('reports'):
+                build_year(year, year_dirs[year], collection_files[year], lastfm_data, args.columnar, args.stream,
+                           args.local_images, args.sharded, assets, args.offline, args.analyze_workers)
+            build_manifest.record(manifest, report_file, report_hash)
     
-    # Generate report
-    logger.info(f"Generating report for {year}...")
-    logger.debug(f"Passing Last.fm data to report generator: {lastfm_data is not None}")
-    generate_report.main(year, year_dir, lastfm_data)
+    # Cross-year views are merged from the rollups each year build wrote
+    built_years = find_built_years()
+    with metrics.stage('alltime'):
+        generate_alltime_html(manifest, built_years)
     
     # Generate/update index.html
-    generate_index_html()
+    with metrics.stage('index'):
+        generate_index_html(manifest, built_years)
+    
+    # Minify and precompress whatever changed
+    if args.publish:
+        with metrics.stage('publish'):
+            publish.publish_tree(os.path.join(base_dir, 'unwrapped'), manifest)
+    build_manifest.save_manifest(manifest)
     
-    logger.info(f"Report generation complete for {year}!")
+    logger.info(f"Report generation complete for {', '.join(map(str, years))}!")
+
+def profile(args):
+    """Run main() under cProfile, save the stats and print the hottest calls"""
+    if args.metrics is None:
+        args.metrics = metrics.default_file()
+    profile_file = os.path.splitext(args.metrics)[0] + '.prof'
+    profiler = cProfile.Profile()
+    try:
+        profiler.runcall(main, args)
+    finally:
+        profiler.dump_stats(profile_file)
+        logger.info(f"Profile written to {profile_file} (report workers are not profiled)")
+        pstats.Stats(profiler).sort_stats('cumulative').print_stats(25)
 
 if __name__ == "__main__":
-    main()
+    args = parse_args()
+    if args.profile:
+        profile(args)
+    else:
+        main(args)
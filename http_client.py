@@ -0,0 +1,140 @@
+import os
+import random
+import threading
+import time
+import logging
+import requests
+import http_replay
+import metrics
+
+logger = logging.getLogger(__name__)
+
+USER_AGENT = 'VinylUnwrapped/1.0'
+DEFAULT_TIMEOUT = 30  # seconds
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+RECORD_FILE = os.getenv('HTTP_RECORD')  # record every response into this cassette
+
+_session = None
+_session_lock = threading.Lock()
+
+def get_session():
+    """Return the shared keep-alive HTTP session"""
+    global _session
+    with _session_lock:
+        if _session is None:
+            _session = requests.Session()
+            _session.headers['User-Agent'] = USER_AGENT
+            _session.hooks['response'].append(metrics.record_response)
+            if RECORD_FILE:
+                http_replay.install_recorder(_session, RECORD_FILE)
+        return _session
+
+class RateLimiter:
+    """Thread-safe token bucket paced by Discogs' rate limit headers.
+
+    Discogs allows `X-Discogs-Ratelimit` requests per moving 60 second
+    window and reports what is left in `X-Discogs-Ratelimit-Remaining`.
+    Tokens refill continuously at limit/window per second, and every
+    response resyncs the bucket with the server's view so we spend the
+    whole budget without tripping 429s.
+    """
+
+    def __init__(self, limit=60, window=60.0, base_delay=1.0, max_delay=60.0, name='http'):
+        self.name = name
+        self.limit = limit
+        self.window = window
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.tokens = float(limit)
+        self.sleep_time = 0.0
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.limit, self.tokens + (now - self._updated) * self.limit / self.window)
+        self._updated = now
+
+    def _sleep(self, seconds):
+        self.sleep_time += seconds
+        metrics.count(f"rate_limit_sleep.{self.name}", seconds)
+        time.sleep(seconds)
+
+    def acquire(self):
+        """Block until a request may be sent"""
+        with self._lock:
+            self._refill()
+            if self.tokens < 1:
+                wait = (1 - self.tokens) * self.window / self.limit
+                logger.debug(f"Rate limiter waiting {wait:.2f}s")
+                self._sleep(wait)
+                self._refill()
+            self.tokens -= 1
+
+    def update(self, headers):
+        """Resync the bucket from X-Discogs-Ratelimit* response headers"""
+        limit = headers.get('X-Discogs-Ratelimit')
+        remaining = headers.get('X-Discogs-Ratelimit-Remaining')
+        used = headers.get('X-Discogs-Ratelimit-Used')
+        with self._lock:
+            self._refill()
+            if limit is not None:
+                self.limit = int(limit)
+            if remaining is None and used is not None:
+                remaining = self.limit - int(used)
+            if remaining is not None:
+                self.tokens = min(self.tokens, float(remaining))
+
+    def backoff(self, attempt, retry_after=None):
+        """Sleep before retrying a throttled or failed request.
+
+        Honours Retry-After when the server sends one, otherwise uses
+        exponential backoff with full jitter.
+        """
+        try:
+            delay = float(retry_after)
+        except (TypeError, ValueError):
+            delay = random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+        logger.warning(f"Backing off for {delay:.2f}s (attempt {attempt + 1})")
+        with self._lock:
+            # Nothing else should go out while we are being throttled
+            self.tokens = min(self.tokens, 0.0)
+        self._sleep(delay)
+
+def request_with_retries(method, url, limiter=None, max_retries=3, **kwargs):
+    """Send a request through the shared session, pacing and retrying it.
+
+    Retries 429 and 5xx responses (and connection errors) up to max_retries
+    times, then returns the last response so callers can handle it.
+    """
+    session = get_session()
+    kwargs.setdefault('timeout', DEFAULT_TIMEOUT)
+    attempt = 0
+    while True:
+        if limiter is not None:
+            limiter.acquire()
+        try:
+            response = session.request(method, url, **kwargs)
+        except requests.ConnectionError:
+            if attempt >= max_retries:
+                raise
+            metrics.count('http.retries')
+            if limiter is not None:
+                limiter.backoff(attempt)
+            else:
+                time.sleep(random.uniform(0, 2 ** attempt))
+            attempt += 1
+            continue
+
+        if limiter is not None:
+            limiter.update(response.headers)
+        if response.status_code not in RETRY_STATUSES or attempt >= max_retries:
+            return response
+
+        metrics.count('http.retries')
+        retry_after = response.headers.get('Retry-After')
+        if limiter is not None:
+            limiter.backoff(attempt, retry_after)
+        else:
+            time.sleep(random.uniform(0, 2 ** attempt))
+        attempt += 1
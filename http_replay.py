@@ -0,0 +1,269 @@
+#!/usr/bin/env python3
+
+import os
+import json
+import time
+import random
+import atexit
+import base64
+import argparse
+import threading
+import logging
+from collections import Counter, deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit, parse_qsl, urlencode
+from requests.adapters import HTTPAdapter
+
+logger = logging.getLogger(__name__)
+
+# Query parameters that must never end up in a cassette
+SECRET_PARAMS = {'api_key', 'token', 'key', 'secret', 'sk'}
+# Response headers worth replaying
+RECORDED_HEADERS = ('Content-Type', 'ETag', 'Last-Modified', 'Retry-After',
+                    'X-Discogs-Ratelimit', 'X-Discogs-Ratelimit-Remaining', 'X-Discogs-Ratelimit-Used')
+# Hosts the fetchers talk to, with the environment override that points each one elsewhere
+SERVICES = {
+    'DISCOGS_API_URL': 'api.discogs.com',
+    'RUSS_FM_INDEX_URL': 'www.russ.fm/index.json',
+    'LASTFM_API_URL': 'ws.audioscrobbler.com/2.0/'
+}
+
+def request_key(method, url):
+    """Identify a request by method, host, path and sorted query, without secrets"""
+    parts = urlsplit(url)
+    query = sorted((name, value) for name, value in parse_qsl(parts.query, keep_blank_values=True)
+                   if name not in SECRET_PARAMS)
+    key = f"{method.upper()} {parts.netloc}{parts.path}"
+    return f"{key}?{urlencode(query)}" if query else key
+
+class Cassette:
+    """Recorded responses, kept per request key in the order they were seen.
+
+    Stored as JSON so cassettes can be inspected and checked in. Bodies are
+    saved as text when they decode as UTF-8 and as base64 otherwise.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.interactions = {}
+        self._lock = threading.Lock()
+        if os.path.exists(path):
+            with open(path, 'r', encoding='utf-8') as f:
+                self.interactions = json.load(f)['interactions']
+
+    def add(self, key, status, headers, body):
+        entry = {
+            'status': status,
+            'headers': {name: headers[name] for name in RECORDED_HEADERS if name in headers}
+        }
+        try:
+            entry['body'] = body.decode('utf-8')
+        except UnicodeDecodeError:
+            entry['body_base64'] = base64.b64encode(body).decode('ascii')
+        with self._lock:
+            self.interactions.setdefault(key, []).append(entry)
+
+    def responses(self, key):
+        return self.interactions.get(key, [])
+
+    def save(self):
+        with self._lock:
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            tmp_path = f"{self.path}.tmp"
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump({'version': 1, 'interactions': self.interactions}, f, indent=1, sort_keys=True)
+            os.replace(tmp_path, self.path)
+        logger.info(f"Saved {sum(map(len, self.interactions.values()))} responses to {self.path}")
+
+def entry_body(entry):
+    if 'body_base64' in entry:
+        return base64.b64decode(entry['body_base64'])
+    return entry['body'].encode('utf-8')
+
+class RecordingAdapter(HTTPAdapter):
+    """Transport adapter that copies every real response into a cassette.
+
+    Throttled, failed and 304 responses are not recorded; the replay server
+    produces those itself.
+    """
+
+    def __init__(self, cassette, **kwargs):
+        super().__init__(**kwargs)
+        self.cassette = cassette
+
+    def send(self, request, **kwargs):
+        response = super().send(request, **kwargs)
+        if response.status_code != 304 and response.status_code != 429 and response.status_code < 500:
+            self.cassette.add(request_key(request.method, request.url), response.status_code,
+                              response.headers, response.content)
+        return response
+
+def install_recorder(session, cassette_file):
+    """Record everything sent through a session; the cassette is saved at exit"""
+    cassette = Cassette(cassette_file)
+    adapter = RecordingAdapter(cassette)
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    atexit.register(cassette.save)
+    logger.info(f"Recording HTTP responses to {cassette_file}")
+    return cassette
+
+class ReplayServer(ThreadingHTTPServer):
+    """Local stub server that answers requests from a cassette.
+
+    Requests arrive as /<original host>/<path>, which is what the URLs in
+    env() produce. Repeated requests get the recorded responses in order,
+    then the last one again. Optionally every response is delayed, a moving
+    window rate limit per host is enforced with Discogs style headers, and
+    a fraction of requests fail with 429.
+    """
+
+    daemon_threads = True
+
+    def __init__(self, cassette, address=('127.0.0.1', 0), latency=0.0, jitter=0.0,
+                 rate_limit=None, window=60.0, error_rate=0.0, retry_after=1, seed=None):
+        super().__init__(address, ReplayHandler)
+        self.cassette = cassette
+        self.latency = latency
+        self.jitter = jitter
+        self.rate_limit = rate_limit
+        self.window = window
+        self.error_rate = error_rate
+        self.retry_after = retry_after
+        self.stats = Counter()
+        self._rng = random.Random(seed)
+        self._positions = Counter()
+        self._requests = {}
+        self._lock = threading.Lock()
+
+    @property
+    def url(self):
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def env(self):
+        """Environment overrides that point the fetchers at this server"""
+        return {name: f"{self.url}/{target}" for name, target in SERVICES.items()}
+
+    def start(self):
+        """Serve from a background thread"""
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self
+
+    def delay(self):
+        with self._lock:
+            delay = self.latency + self._rng.uniform(0, self.jitter)
+            inject = self._rng.random() < self.error_rate
+        return delay, inject
+
+    def take(self, host):
+        """Count a request against the host's window; returns requests left, or None when throttled"""
+        now = time.monotonic()
+        with self._lock:
+            sent = self._requests.setdefault(host, deque())
+            while sent and now - sent[0] >= self.window:
+                sent.popleft()
+            if len(sent) >= self.rate_limit:
+                return None
+            sent.append(now)
+            return self.rate_limit - len(sent)
+
+    def next_response(self, key):
+        responses = self.cassette.responses(key)
+        if not responses:
+            return None
+        with self._lock:
+            position = self._positions[key]
+            self._positions[key] += 1
+        return responses[min(position, len(responses) - 1)]
+
+class ReplayHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        logger.debug(format % args)
+
+    def send(self, status, headers, body=b''):
+        self.send_response(status)
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        server = self.server
+        server.stats['requests'] += 1
+        host, _, path = self.path.lstrip('/').partition('/')
+        key = request_key(self.command, f"http://{host}/{path}")
+        
+        delay, inject = server.delay()
+        if delay:
+            time.sleep(delay)
+        
+        headers = {}
+        if server.rate_limit:
+            remaining = server.take(host)
+            headers['X-Discogs-Ratelimit'] = str(server.rate_limit)
+            headers['X-Discogs-Ratelimit-Remaining'] = str(remaining or 0)
+            headers['X-Discogs-Ratelimit-Used'] = str(server.rate_limit - (remaining or 0))
+            if remaining is None:
+                server.stats['throttled'] += 1
+                self.send(429, dict(headers, **{'Retry-After': str(server.retry_after)}), b'{"message": "throttled"}')
+                return
+        if inject:
+            server.stats['injected_429'] += 1
+            self.send(429, dict(headers, **{'Retry-After': str(server.retry_after)}), b'{"message": "injected"}')
+            return
+        
+        entry = server.next_response(key)
+        if entry is None:
+            server.stats['misses'] += 1
+            logger.warning(f"No recorded response for {key}")
+            self.send(404, {'Content-Type': 'application/json'}, json.dumps({'message': f"Not recorded: {key}"}).encode())
+            return
+        
+        headers = dict(entry['headers'], **headers)
+        etag = entry['headers'].get('ETag')
+        if etag and self.headers.get('If-None-Match') == etag:
+            server.stats['not_modified'] += 1
+            self.send(304, headers)
+            return
+        server.stats['hits'] += 1
+        self.send(entry['status'], headers, entry_body(entry))
+
+    do_POST = do_GET
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Serve recorded Discogs, russ.fm and Last.fm responses locally')
+    parser.add_argument('cassette', help='Cassette recorded with HTTP_RECORD=<file>')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--latency', type=float, default=0.0, help='Seconds added to every response')
+    parser.add_argument('--jitter', type=float, default=0.0, help='Up to this many extra random seconds')
+    parser.add_argument('--rate-limit', type=int, help='Requests allowed per host per window (sends rate limit headers)')
+    parser.add_argument('--window', type=float, default=60.0, help='Rate limit window in seconds')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='Fraction of requests answered with 429')
+    parser.add_argument('--retry-after', type=int, default=1, help='Retry-After seconds sent with 429s')
+    parser.add_argument('--seed', type=int, help='Seed for latency jitter and injected errors')
+    return parser.parse_args()
+
+def main():
+    logging.basicConfig(level=logging.INFO)
+    args = parse_args()
+    server = ReplayServer(
+        Cassette(args.cassette), ('127.0.0.1', args.port), latency=args.latency, jitter=args.jitter,
+        rate_limit=args.rate_limit, window=args.window, error_rate=args.error_rate,
+        retry_after=args.retry_after, seed=args.seed
+    )
+    print("Point the fetchers at this server with:")
+    for name, value in server.env().items():
+        print(f"  export {name}={value}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        logger.info(f"Served {dict(server.stats)}")
+
+if __name__ == "__main__":
+    main()
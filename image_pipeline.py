@@ -0,0 +1,187 @@
+import os
+import json
+import time
+import hashlib
+import mimetypes
+import logging
+from concurrent.futures import ThreadPoolExecutor
+import metrics
+from build_manifest import atomic_open
+from collection_store import CACHE_DIR
+
+try:
+    from PIL import Image
+except ImportError:  # Pillow is optional; without it originals are served locally
+    Image = None
+
+logger = logging.getLogger(__name__)
+
+IMAGE_CACHE_DIR = os.path.join(CACHE_DIR, 'images')
+# One small metadata file per URL, so parallel year builds never overwrite
+# each other's downloads the way a shared index would
+IMAGE_ENTRY_DIR = os.path.join(IMAGE_CACHE_DIR, 'entries')
+# Defaults for IMAGE_CACHE_MAX_AGE and IMAGE_WORKERS, which are read at call
+# time so a .env loaded by the entry point still applies
+DEFAULT_IMAGE_MAX_AGE = 7 * 24 * 3600  # seconds before revalidating
+DEFAULT_IMAGE_WORKERS = 8
+THUMBNAIL_WIDTHS = (160, 320, 640)
+THUMBNAIL_QUALITY = 80
+IMAGE_SIZES = '(min-width: 992px) 25vw, (min-width: 768px) 50vw, 100vw'
+
+def entry_path(url):
+    return os.path.join(IMAGE_ENTRY_DIR, f"{hashlib.sha256(url.encode('utf-8')).hexdigest()}.json")
+
+def load_entry(url):
+    """Load the cached image metadata for a URL, or None"""
+    path = entry_path(url)
+    if not os.path.exists(path):
+        return None
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+def save_entry(url, entry):
+    os.makedirs(IMAGE_ENTRY_DIR, exist_ok=True)
+    with atomic_open(entry_path(url)) as f:
+        json.dump(entry, f, sort_keys=True)
+
+def object_path(entry):
+    """Path of a cached original, named by the hash of its content"""
+    return os.path.join(IMAGE_CACHE_DIR, 'objects', f"{entry['hash']}{entry['ext']}")
+
+def download_image(url, entry=None):
+    """Download an image into the content-addressed cache.
+    
+    Fresh cache entries are used without a request; stale ones are
+    revalidated with ETag/Last-Modified so unchanged images cost a 304.
+    Returns the updated index entry, or the old one (possibly None) on error.
+    """
+    max_age = int(os.getenv('IMAGE_CACHE_MAX_AGE', DEFAULT_IMAGE_MAX_AGE))
+    if entry and os.path.exists(object_path(entry)) and time.time() - entry['checked_at'] < max_age:
+        metrics.cache_hit('images', True)
+        return entry
+    
+    headers = {}
+    if entry and os.path.exists(object_path(entry)):
+        if entry.get('etag'):
+            headers['If-None-Match'] = entry['etag']
+        if entry.get('last_modified'):
+            headers['If-Modified-Since'] = entry['last_modified']
+    # Imported here so rendering from cached images never loads the HTTP stack
+    import http_client
+    try:
+        response = http_client.request_with_retries('GET', url, headers=headers)
+        metrics.cache_hit('images', response.status_code == 304)
+        if response.status_code == 304:
+            return dict(entry, checked_at=time.time())
+        response.raise_for_status()
+    except Exception as e:
+        logger.warning(f"Could not download {url}: {str(e)}")
+        return entry
+    
+    content_type = response.headers.get('Content-Type', '').split(';')[0]
+    new_entry = {
+        'hash': hashlib.sha256(response.content).hexdigest(),
+        'ext': mimetypes.guess_extension(content_type) or os.path.splitext(url.split('?')[0])[1] or '.img',
+        'etag': response.headers.get('ETag'),
+        'last_modified': response.headers.get('Last-Modified'),
+        'checked_at': time.time()
+    }
+    path = object_path(new_entry)
+    if not os.path.exists(path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with atomic_open(path, 'wb') as f:
+            f.write(response.content)
+    return new_entry
+
+def publish_image(entry, images_dir, url_prefix):
+    """Write an image's published variants and return its src/srcset.
+    
+    With Pillow, WebP thumbnails are made at each width up to the original
+    width; without it the original is copied as is.
+    """
+    src_path = object_path(entry)
+    if Image is None:
+        name = f"{entry['hash']}{entry['ext']}"
+        target = os.path.join(images_dir, name)
+        if not os.path.exists(target):
+            with open(src_path, 'rb') as src, atomic_open(target, 'wb') as dst:
+                dst.write(src.read())
+        return {'src': url_prefix + name, 'srcset': None}
+    
+    variants = []
+    with Image.open(src_path) as image:
+        widths = [width for width in THUMBNAIL_WIDTHS if width < image.width] or [image.width]
+        for width in widths:
+            name = f"{entry['hash']}-{width}.webp"
+            target = os.path.join(images_dir, name)
+            if not os.path.exists(target):
+                thumbnail = image.convert('RGB')
+                thumbnail.thumbnail((width, width * 4))
+                with atomic_open(target, 'wb') as f:
+                    thumbnail.save(f, 'WEBP', quality=THUMBNAIL_QUALITY)
+            variants.append((width, url_prefix + name))
+    return {
+        'src': variants[len(variants) // 2][1],
+        'srcset': ', '.join(f"{url} {width}w" for width, url in variants)
+    }
+
+def cached_image(url, entry=None):
+    """Offline stand-in for download_image: use whatever is already cached"""
+    if entry and os.path.exists(object_path(entry)):
+        metrics.cache_hit('images', True)
+        return entry
+    return None
+
+def localize_images(stats, images_dir, url_prefix='../images/', workers=None, offline=False):
+    """Download the report's images and point the template context at local copies.
+    
+    Sets cover_src/cover_srcset on each record and image_src/image_srcset
+    on each top artist. Images that cannot be fetched keep their remote URL.
+    With offline=True only images already in the cache are used.
+    """
+    if workers is None:
+        workers = int(os.getenv('IMAGE_WORKERS', DEFAULT_IMAGE_WORKERS))
+    os.makedirs(images_dir, exist_ok=True)
+    
+    records = [record for month_records in stats['records_by_month'].values() for record in month_records]
+    urls = {record['cover_image'] for record in records if record.get('cover_image')}
+    urls.update(artist['records'][0]['artist_image'] for artist in stats['top_artists']
+                if artist['records'] and artist['records'][0].get('artist_image'))
+    urls = sorted(urls)
+    
+    fetch = cached_image if offline else download_image
+    
+    def fetch_entry(url):
+        old = load_entry(url)
+        entry = fetch(url, old)
+        if entry and entry is not old:
+            save_entry(url, entry)
+        return entry
+    
+    index = {}
+    published = {}
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+        for url, entry in zip(urls, executor.map(fetch_entry, urls)):
+            if entry:
+                index[url] = entry
+        jobs = {url: executor.submit(publish_image, index[url], images_dir, url_prefix)
+                for url in urls if url in index}
+        for url, job in jobs.items():
+            try:
+                published[url] = job.result()
+            except Exception as e:
+                logger.warning(f"Could not process image {url}: {str(e)}")
+    
+    for record in records:
+        image = published.get(record.get('cover_image'))
+        if image:
+            record['cover_src'] = image['src']
+            record['cover_srcset'] = image['srcset']
+    for artist in stats['top_artists']:
+        image = published.get(artist['records'][0].get('artist_image')) if artist['records'] else None
+        if image:
+            artist['image_src'] = image['src']
+            artist['image_srcset'] = image['srcset']
+    
+    logger.info(f"Localized {len(published)} of {len(urls)} images")
+    return stats
@@ -0,0 +1,136 @@
+import os
+import sys
+import json
+import time
+import threading
+import logging
+from collections import Counter, defaultdict
+from contextlib import contextmanager
+from datetime import datetime
+from urllib.parse import urlsplit
+from collection_store import CACHE_DIR
+
+logger = logging.getLogger(__name__)
+
+METRICS_DIR = os.path.join(CACHE_DIR, 'metrics')
+
+_lock = threading.Lock()
+_local = threading.local()
+_stages = {}
+_counters = Counter()
+_http = defaultdict(Counter)
+_started = (time.perf_counter(), time.process_time())
+
+def reset():
+    """Forget everything recorded so far, e.g. at the start of a worker job"""
+    global _started
+    with _lock:
+        _stages.clear()
+        _counters.clear()
+        _http.clear()
+        _started = (time.perf_counter(), time.process_time())
+    # Forked workers inherit the parent's open stages
+    _local.stack = []
+
+@contextmanager
+def stage(name):
+    """Record wall and CPU time for a block of work.
+
+    Stages nest, and a nested stage is recorded under its parent's path,
+    e.g. "sync/russ_fm". CPU time is for the whole process, so it includes
+    any worker threads running at the same time.
+    """
+    stack = getattr(_local, 'stack', None)
+    if stack is None:
+        stack = _local.stack = []
+    stack.append(name)
+    path = '/'.join(stack)
+    wall, cpu = time.perf_counter(), time.process_time()
+    try:
+        yield
+    finally:
+        wall, cpu = time.perf_counter() - wall, time.process_time() - cpu
+        stack.pop()
+        with _lock:
+            entry = _stages.setdefault(path, {'wall': 0.0, 'cpu': 0.0, 'calls': 0})
+            entry['wall'] += wall
+            entry['cpu'] += cpu
+            entry['calls'] += 1
+
+def count(name, value=1):
+    """Add to a named counter (seconds, bytes or events)"""
+    with _lock:
+        _counters[name] += value
+
+def cache_hit(name, hit):
+    """Count a cache lookup; hit rates are derived from these in the report"""
+    count(f"cache.{name}.{'hit' if hit else 'miss'}")
+
+def record_response(response, *args, **kwargs):
+    """requests response hook counting requests, statuses and bytes per host"""
+    host = urlsplit(response.url).netloc
+    body = response.request.body
+    with _lock:
+        stats = _http[host]
+        stats['requests'] += 1
+        stats[f"status_{response.status_code}"] += 1
+        stats['bytes_received'] += len(response.content)
+        stats['bytes_sent'] += len(body) if body else 0
+        stats['seconds'] += response.elapsed.total_seconds()
+
+def snapshot():
+    """Everything recorded so far, as plain data that can cross processes"""
+    with _lock:
+        return {
+            'stages': {path: dict(entry) for path, entry in _stages.items()},
+            'counters': dict(_counters),
+            'http': {host: dict(stats) for host, stats in _http.items()}
+        }
+
+def merge(other, prefix=None):
+    """Fold in a snapshot from a worker process, optionally under a stage path"""
+    with _lock:
+        for path, entry in other['stages'].items():
+            path = f"{prefix}/{path}" if prefix else path
+            target = _stages.setdefault(path, {'wall': 0.0, 'cpu': 0.0, 'calls': 0})
+            for key in target:
+                target[key] += entry[key]
+        _counters.update(other['counters'])
+        for host, stats in other['http'].items():
+            _http[host].update(stats)
+
+def cache_rates(counters):
+    rates = {}
+    for name, value in counters.items():
+        if name.startswith('cache.'):
+            cache, outcome = name[len('cache.'):].rsplit('.', 1)
+            rates.setdefault(cache, {'hit': 0, 'miss': 0})[outcome] += value
+    for stats in rates.values():
+        stats['hit_rate'] = round(stats['hit'] / (stats['hit'] + stats['miss']), 4)
+    return rates
+
+def default_file():
+    """Metrics file name for this run, unique per process even within the same second"""
+    return os.path.join(METRICS_DIR, f"run-{datetime.now():%Y%m%d-%H%M%S-%f}-{os.getpid()}.json")
+
+def write(metrics_file=None, **extra):
+    """Write this run's metrics as JSON and return the file name"""
+    data = snapshot()
+    data['cache'] = cache_rates(data['counters'])
+    data['total'] = {
+        'wall': time.perf_counter() - _started[0],
+        'cpu': time.process_time() - _started[1]
+    }
+    data['argv'] = sys.argv
+    data.update(extra)
+    
+    if metrics_file is None:
+        metrics_file = default_file()
+    os.makedirs(os.path.dirname(os.path.abspath(metrics_file)), exist_ok=True)
+    with open(metrics_file, 'w', encoding='utf-8') as f:
+        json.dump(data, f, indent=2, sort_keys=True)
+    
+    for path, entry in sorted(data['stages'].items()):
+        logger.info(f"{path:<40} wall {entry['wall']:8.2f}s  cpu {entry['cpu']:8.2f}s  x{entry['calls']}")
+    logger.info(f"Metrics written to {metrics_file}")
+    return metrics_file
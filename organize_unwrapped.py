@@ -2,6 +2,7 @@ import os
 import shutil
 from datetime import datetime
 import re
+import publish
 
 def setup_directory_structure():
     base_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'unwrapped')
@@ -24,11 +25,19 @@ def copy_static_files():
         )
     
     # Copy JS files
-    if os.path.exists(os.path.join(static_dir, 'js', 'charts.js')):
-        shutil.copy2(
-            os.path.join(static_dir, 'js', 'charts.js'),
-            os.path.join(unwrapped_dir, 'js', 'charts.js')
-        )
+    for js_file in ['charts.js', 'months.js']:
+        if os.path.exists(os.path.join(static_dir, 'js', js_file)):
+            shutil.copy2(
+                os.path.join(static_dir, 'js', js_file),
+                os.path.join(unwrapped_dir, 'js', js_file)
+            )
+    
+    # Also publish minified copies under content-hashed names for long-term caching
+    publish.fingerprint_static(static_dir, unwrapped_dir, [
+        os.path.join('css', 'style.css'),
+        os.path.join('js', 'charts.js'),
+        os.path.join('js', 'months.js')
+    ])
 
 def organize_reports():
     base_dir = os.path.dirname(os.path.abspath(__file__))
@@ -0,0 +1,166 @@
+import os
+import re
+import gzip
+import json
+import hashlib
+import logging
+import build_manifest
+from build_manifest import atomic_open
+
+try:
+    import brotli
+except ImportError:  # brotli is optional; without it only .gz siblings are written
+    brotli = None
+
+logger = logging.getLogger(__name__)
+
+TEXT_EXTENSIONS = ('.html', '.css', '.js', '.json', '.svg')
+COMPRESSED_EXTENSIONS = ('.gz', '.br')
+MIN_COMPRESS_SIZE = 256  # bytes; smaller files are not worth a compressed sibling
+FINGERPRINT_LENGTH = 10
+KEEP_GENERATIONS = 1  # superseded fingerprinted copies kept for pages that are still cached
+ASSET_MANIFEST = 'assets.json'
+
+HTML_COMMENT_RE = re.compile(r'<!--(?!\[if).*?-->', re.S)
+CSS_COMMENT_RE = re.compile(r'/\*.*?\*/', re.S)
+CSS_SPACE_RE = re.compile(r'\s*([{};,>])\s*')
+
+def minify_html(text):
+    """Drop comments, indentation and blank lines.
+
+    Line breaks are kept so inline scripts (and their // comments) still work.
+    """
+    text = HTML_COMMENT_RE.sub('', text)
+    return '\n'.join(line.strip() for line in text.splitlines() if line.strip())
+
+def minify_css(text):
+    text = CSS_COMMENT_RE.sub('', text)
+    text = ' '.join(text.split())
+    text = CSS_SPACE_RE.sub(r'\1', text)
+    text = re.sub(r':\s+', ':', text)
+    return text.replace(';}', '}')
+
+def minify_js(text):
+    """Drop indentation, blank lines and whole-line comments, keeping line breaks for ASI"""
+    lines = (line.strip() for line in text.splitlines())
+    return '\n'.join(line for line in lines if line and not line.startswith('//'))
+
+MINIFIERS = {'.html': minify_html, '.css': minify_css, '.js': minify_js}
+
+def minify(path, text):
+    minifier = MINIFIERS.get(os.path.splitext(path)[1])
+    return minifier(text) if minifier else text
+
+def fingerprinted_name(path, content):
+    """js/charts.js -> js/charts.<hash>.js"""
+    root, ext = os.path.splitext(path)
+    digest = hashlib.sha256(content.encode('utf-8')).hexdigest()[:FINGERPRINT_LENGTH]
+    return f"{root}.{digest}{ext}"
+
+def remove_stale_fingerprints(target):
+    """Remove superseded fingerprinted copies (and their compressed siblings) of a file.
+
+    The last KEEP_GENERATIONS copies before target are kept, so pages that
+    browsers or CDNs still cache can load the assets they link to. Every
+    publish touches the current copy, so the most recently modified
+    superseded copy is the one that was current last.
+    """
+    directory, name = os.path.split(target)
+    root, ext = os.path.splitext(name)
+    stem = root.rsplit('.', 1)[0]
+    pattern = re.compile(rf'^({re.escape(stem)}\.[0-9a-f]{{{FINGERPRINT_LENGTH}}}{re.escape(ext)})(\.gz|\.br)?$')
+    superseded = {}
+    for existing in os.listdir(directory):
+        match = pattern.match(existing)
+        if match and match.group(1) != name:
+            superseded.setdefault(match.group(1), []).append(existing)
+    
+    def last_current(copy):
+        path = os.path.join(directory, copy)
+        return os.path.getmtime(path) if os.path.exists(path) else 0
+    
+    for copy in sorted(superseded, key=last_current, reverse=True)[KEEP_GENERATIONS:]:
+        for existing in superseded[copy]:
+            os.remove(os.path.join(directory, existing))
+
+def fingerprint_static(static_dir, output_dir, static_files):
+    """Write minified, content-hashed copies of the static files.
+
+    Returns a mapping from each static path to its fingerprinted path
+    (e.g. js/charts.js -> js/charts.1a2b3c4d5e.js), which is also saved as
+    assets.json. A changed file gets a new name, so the old one can be
+    cached forever.
+    """
+    assets = {}
+    for static_file in static_files:
+        src = os.path.join(static_dir, static_file)
+        if not os.path.exists(src):
+            continue
+        with open(src, 'r', encoding='utf-8') as f:
+            content = minify(static_file, f.read())
+        name = fingerprinted_name(static_file, content)
+        target = os.path.join(output_dir, name)
+        if not os.path.exists(target):
+            with atomic_open(target) as f:
+                f.write(content)
+            logger.info(f"Published {name}")
+        else:
+            # Marks it as the current copy for remove_stale_fingerprints
+            os.utime(target)
+        remove_stale_fingerprints(target)
+        assets[static_file.replace(os.sep, '/')] = name.replace(os.sep, '/')
+    
+    with atomic_open(os.path.join(output_dir, ASSET_MANIFEST)) as f:
+        json.dump(assets, f, indent=2, sort_keys=True)
+    return assets
+
+def compress_file(path):
+    """Write .gz (and, with brotli installed, .br) siblings when they are smaller"""
+    with open(path, 'rb') as f:
+        data = f.read()
+    siblings = {'.gz': gzip.compress(data, compresslevel=9, mtime=0)}
+    if brotli is not None:
+        siblings['.br'] = brotli.compress(data, quality=11)
+    for ext, compressed in siblings.items():
+        if len(compressed) < len(data):
+            with atomic_open(path + ext, 'wb') as f:
+                f.write(compressed)
+        elif os.path.exists(path + ext):
+            os.remove(path + ext)
+
+def publish_tree(output_dir, manifest):
+    """Minify HTML pages and precompress every text file under output_dir.
+
+    Compressed siblings are only rebuilt when their source changed, and
+    siblings whose source no longer exists are removed.
+    """
+    published = 0
+    for root, _, files in os.walk(output_dir):
+        for name in files:
+            path = os.path.join(root, name)
+            if name.endswith(COMPRESSED_EXTENSIONS):
+                if not os.path.exists(path[:-3]):
+                    os.remove(path)
+                continue
+            if not name.endswith(TEXT_EXTENSIONS):
+                continue
+            
+            if name.endswith('.html'):
+                with open(path, 'r', encoding='utf-8') as f:
+                    text = f.read()
+                minified = minify_html(text)
+                if minified != text:
+                    with atomic_open(path) as f:
+                        f.write(minified)
+            
+            if os.path.getsize(path) < MIN_COMPRESS_SIZE:
+                continue
+            source_hash = build_manifest.hash_file(path)
+            if build_manifest.is_up_to_date(manifest, path + '.gz', source_hash):
+                continue
+            compress_file(path)
+            build_manifest.record(manifest, path + '.gz', source_hash)
+            published += 1
+    
+    logger.info(f"Precompressed {published} changed files{'' if brotli else ' (gzip only, brotli not installed)'}")
+    return published
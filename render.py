@@ -0,0 +1,66 @@
+import os
+import logging
+from jinja2 import Environment, FileSystemLoader, FileSystemBytecodeCache, pass_context
+from collection_store import CACHE_DIR
+from build_manifest import atomic_open
+
+logger = logging.getLogger(__name__)
+
+BYTECODE_CACHE_DIR = os.path.join(CACHE_DIR, 'jinja')
+STREAM_BUFFER_SIZE = 64  # template chunks per write when streaming
+
+_environments = {}
+
+@pass_context
+def asset_url(context, path):
+    """Resolve a static file to its published (fingerprinted) URL.
+
+    Uses the page's assets mapping when publishing, the plain path otherwise,
+    prefixed with static_prefix so year pages can reach the site root.
+    """
+    return context.get('static_prefix', '') + context.get('assets', {}).get(path, path)
+
+def get_environment(template_dir='templates'):
+    """Return the shared Jinja environment for a template directory.
+
+    Compiled templates are kept in memory and only recompiled when the
+    template file's mtime changes (auto_reload), and the compiled bytecode
+    is cached on disk so new processes skip compilation too.
+    """
+    template_dir = os.path.abspath(template_dir)
+    env = _environments.get(template_dir)
+    if env is None:
+        os.makedirs(BYTECODE_CACHE_DIR, exist_ok=True)
+        env = Environment(
+            loader=FileSystemLoader(template_dir),
+            bytecode_cache=FileSystemBytecodeCache(BYTECODE_CACHE_DIR),
+            auto_reload=True
+        )
+        env.globals['asset_url'] = asset_url
+        _environments[template_dir] = env
+    return env
+
+def get_template(name, template_dir='templates'):
+    """Load a template through the shared environment"""
+    return get_environment(template_dir).get_template(name)
+
+def render(name, template_dir='templates', **context):
+    """Render a template to a string"""
+    return get_template(name, template_dir).render(**context)
+
+def render_to_file(name, output_file, template_dir='templates', stream=False, **context):
+    """Render a template straight to a file.
+
+    With stream=True the output is generated and written in chunks rather
+    than built as one string, which keeps memory flat for large reports.
+    The file is replaced atomically, so readers never see a partial page.
+    """
+    template = get_template(name, template_dir)
+    with atomic_open(output_file) as f:
+        if stream:
+            template_stream = template.stream(**context)
+            template_stream.enable_buffering(STREAM_BUFFER_SIZE)
+            template_stream.dump(f)
+        else:
+            f.write(template.render(**context))
+    logger.debug(f"Rendered {name} to {output_file}{' (streamed)' if stream else ''}")
@@ -0,0 +1,131 @@
+import os
+import json
+import logging
+from collections import Counter
+from build_manifest import atomic_open
+
+logger = logging.getLogger(__name__)
+
+ROLLUP_FILE = 'rollup.json'
+ROLLUP_VERSION = 1
+COUNTERS = ('genres', 'styles', 'formats', 'labels', 'artists')
+TOP_ITEMS = 10
+TOP_ARTISTS = 12
+TREND_GENRES = 5  # genres charted year over year
+
+def build_rollup(stats, lastfm_data=None):
+    """Reduce a year's analysis to the counts needed for cross-year views.
+    
+    The rollup keeps full counters (not just the top five), so merging
+    rollups gives exact all-time rankings. Records themselves are dropped;
+    only the links and images of the year's top artists are kept for cards.
+    """
+    rollup = {
+        'version': ROLLUP_VERSION,
+        'year': stats['year'],
+        'total_records': stats['total_records'],
+        'monthly_data': list(stats['monthly_data']),
+        'artist_info': {
+            artist['name']: {
+                'image': artist.get('image_src') or artist['image'],
+                'srcset': artist.get('image_srcset'),
+                'uri': artist['records'][0].get('artist_uri') if artist['records'] else None
+            }
+            for artist in stats['top_artists']
+        },
+        'total_scrobbles': lastfm_data['total_scrobbles'] if lastfm_data else None
+    }
+    for name in COUNTERS:
+        rollup[name] = stats[name]
+    return rollup
+
+def rollup_path(year_dir):
+    return os.path.join(year_dir, ROLLUP_FILE)
+
+def write_rollup(rollup, year_dir):
+    """Write a year's rollup next to its report"""
+    with atomic_open(rollup_path(year_dir)) as f:
+        json.dump(rollup, f, separators=(',', ':'), ensure_ascii=False, sort_keys=True)
+
+def load_rollups(unwrapped_dir, years):
+    """Load the rollups of the given years, oldest first.
+    
+    Years without a rollup (built before rollups existed) are skipped.
+    """
+    rollups = []
+    for year in sorted(years):
+        path = rollup_path(os.path.join(unwrapped_dir, str(year)))
+        if not os.path.exists(path):
+            logger.warning(f"No rollup for {year}; rebuild it to include it in the all-time report")
+            continue
+        with open(path, 'r', encoding='utf-8') as f:
+            rollup = json.load(f)
+        if rollup.get('version') != ROLLUP_VERSION:
+            logger.warning(f"Ignoring outdated rollup for {year}; rebuild it to include it")
+            continue
+        rollups.append(rollup)
+    return rollups
+
+def yearly_series(rollups):
+    """Per-year series for the year-over-year charts"""
+    genre_totals = Counter()
+    for rollup in rollups:
+        genre_totals.update(rollup['genres'])
+    trend_genres = [genre for genre, _ in genre_totals.most_common(TREND_GENRES)]
+    return {
+        'years': [rollup['year'] for rollup in rollups],
+        'records': [rollup['total_records'] for rollup in rollups],
+        'scrobbles': [rollup['total_scrobbles'] for rollup in rollups],
+        'genres': {genre: [rollup['genres'].get(genre, 0) for rollup in rollups] for genre in trend_genres}
+    }
+
+def merge_rollups(rollups):
+    """Combine yearly rollups into the all-time stats for the template.
+    
+    Costs O(years x distinct names); no collection file is read.
+    """
+    counters = {name: Counter() for name in COUNTERS}
+    monthly_data = [0] * 12
+    artist_info = {}
+    for rollup in rollups:
+        for name in COUNTERS:
+            counters[name].update(rollup[name])
+        monthly_data = [total + count for total, count in zip(monthly_data, rollup['monthly_data'])]
+        # The most recent year's links and images win
+        artist_info.update(rollup['artist_info'])
+    
+    top_artists = [
+        dict(artist_info.get(name, {}), name=name, count=count)
+        for name, count in counters['artists'].most_common()
+        if name.lower() != 'various'
+    ][:TOP_ARTISTS]
+    
+    per_year = []
+    for rollup in rollups:
+        top_genre = Counter(rollup['genres']).most_common(1)
+        top_artist = [(name, count) for name, count in Counter(rollup['artists']).most_common()
+                      if name.lower() != 'various'][:1]
+        per_year.append({
+            'year': rollup['year'],
+            'total_records': rollup['total_records'],
+            'total_scrobbles': rollup['total_scrobbles'],
+            'top_genre': top_genre[0][0] if top_genre else None,
+            'top_artist': top_artist[0][0] if top_artist else None
+        })
+    
+    scrobbles = [rollup['total_scrobbles'] for rollup in rollups if rollup['total_scrobbles'] is not None]
+    return {
+        'years': [rollup['year'] for rollup in rollups],
+        'total_records': sum(rollup['total_records'] for rollup in rollups),
+        'total_scrobbles': sum(scrobbles) if scrobbles else None,
+        'monthly_data': monthly_data,
+        'top_genres': dict(counters['genres'].most_common(TOP_ITEMS)),
+        'top_styles': dict(counters['styles'].most_common(TOP_ITEMS)),
+        'top_formats': dict(counters['formats'].most_common(TOP_ITEMS)),
+        'top_labels': dict(counters['labels'].most_common(TOP_ITEMS)),
+        'top_artists': top_artists,
+        'distinct_artists': len(counters['artists']),
+        'distinct_labels': len(counters['labels']),
+        'per_year': per_year,
+        'series': yearly_series(rollups)
+    }
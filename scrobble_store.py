@@ -0,0 +1,95 @@
+import os
+import sqlite3
+import logging
+from collection_store import CACHE_DIR
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_DB = os.path.join(CACHE_DIR, 'scrobbles.sqlite3')
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS scrobbles (
+    ts INTEGER NOT NULL,
+    artist TEXT NOT NULL,
+    album TEXT NOT NULL DEFAULT '',
+    track TEXT NOT NULL,
+    PRIMARY KEY (ts, artist, track)
+);
+CREATE TABLE IF NOT EXISTS fetched_ranges (
+    start_ts INTEGER NOT NULL,
+    end_ts INTEGER NOT NULL,
+    PRIMARY KEY (start_ts, end_ts)
+);
+"""
+
+def open_store(db_file=None):
+    """Open (and create if needed) the local scrobble store"""
+    if db_file is None:
+        db_file = DEFAULT_DB
+    os.makedirs(os.path.dirname(os.path.abspath(db_file)), exist_ok=True)
+    conn = sqlite3.connect(db_file)
+    conn.executescript(SCHEMA)
+    return conn
+
+def append_scrobbles(conn, scrobbles):
+    """Append (ts, artist, album, track) rows, ignoring ones already stored.
+    
+    Returns the number of new rows.
+    """
+    before = conn.total_changes
+    conn.executemany(
+        'INSERT OR IGNORE INTO scrobbles (ts, artist, album, track) VALUES (?, ?, ?, ?)',
+        scrobbles
+    )
+    return conn.total_changes - before
+
+def mark_fetched(conn, start_ts, end_ts):
+    """Record that every scrobble between start_ts and end_ts is stored"""
+    conn.execute(
+        'INSERT OR IGNORE INTO fetched_ranges (start_ts, end_ts) VALUES (?, ?)',
+        (start_ts, end_ts)
+    )
+
+def missing_ranges(conn, start_ts, end_ts):
+    """Return the (start, end) gaps in [start_ts, end_ts] not fetched yet"""
+    rows = conn.execute(
+        'SELECT start_ts, end_ts FROM fetched_ranges '
+        'WHERE end_ts >= ? AND start_ts <= ? ORDER BY start_ts',
+        (start_ts, end_ts)
+    )
+    gaps = []
+    cursor = start_ts
+    for range_start, range_end in rows:
+        if range_start > cursor:
+            gaps.append((cursor, range_start - 1))
+        cursor = max(cursor, range_end + 1)
+        if cursor > end_ts:
+            break
+    if cursor <= end_ts:
+        gaps.append((cursor, end_ts))
+    return gaps
+
+def count_scrobbles(conn, start_ts, end_ts):
+    """Count scrobbles between two timestamps (inclusive)"""
+    return conn.execute(
+        'SELECT COUNT(*) FROM scrobbles WHERE ts BETWEEN ? AND ?', (start_ts, end_ts)
+    ).fetchone()[0]
+
+def top_artists(conn, start_ts, end_ts, limit=10):
+    """Most scrobbled artists between two timestamps as [name, count] pairs"""
+    rows = conn.execute(
+        'SELECT artist, COUNT(*) AS plays FROM scrobbles WHERE ts BETWEEN ? AND ? '
+        'GROUP BY artist ORDER BY plays DESC, MAX(ts) DESC LIMIT ?',
+        (start_ts, end_ts, limit)
+    )
+    return [[artist, plays] for artist, plays in rows]
+
+def top_albums(conn, start_ts, end_ts, limit=10):
+    """Most scrobbled albums between two timestamps as ["artist - album", count] pairs"""
+    rows = conn.execute(
+        "SELECT artist, album, COUNT(*) AS plays FROM scrobbles "
+        "WHERE ts BETWEEN ? AND ? AND album != '' "
+        'GROUP BY artist, album ORDER BY plays DESC, MAX(ts) DESC LIMIT ?',
+        (start_ts, end_ts, limit)
+    )
+    return [[f"{artist} - {album}", plays] for artist, album, plays in rows]
@@ -0,0 +1,29 @@
+import os
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+ENV_FILE = os.path.join(BASE_DIR, '.env')
+
+def load_env(path=ENV_FILE):
+    """Load KEY=VALUE settings from .env into the environment.
+
+    Variables already set in the environment win, as with python-dotenv.
+    This small parser covers what .env.example uses (comments, blank lines,
+    optional quotes and "export"), so builds can read their settings
+    without importing python-dotenv; the fetchers still load .env through
+    it for their credentials.
+    """
+    if not os.path.exists(path):
+        return
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            line = line.strip()
+            if line.startswith('export '):
+                line = line[len('export '):].lstrip()
+            if not line or line.startswith('#') or '=' not in line:
+                continue
+            key, value = (part.strip() for part in line.split('=', 1))
+            if value[:1] in ('"', "'") and value.find(value[0], 1) > 0:
+                value = value[1:value.index(value[0], 1)]
+            else:
+                value = value.split(' #', 1)[0].rstrip()
+            os.environ.setdefault(key, value)
@@ -0,0 +1,96 @@
+// Render month sections whose records are kept in JSON shards as they scroll into view
+document.addEventListener('DOMContentLoaded', function() {
+    const sections = document.querySelectorAll('[data-month-shard]');
+    if (!sections.length) {
+        return;
+    }
+    
+    function element(tag, className, text) {
+        const node = document.createElement(tag);
+        if (className) {
+            node.className = className;
+        }
+        if (text !== undefined) {
+            node.textContent = text;
+        }
+        return node;
+    }
+    
+    function recordCard(record, sizes) {
+        const col = element('div', 'col');
+        const card = element('div', 'card h-100 record-card');
+        const link = element('a', 'text-decoration-none text-white');
+        link.href = record.album_uri;
+        link.target = '_blank';
+        
+        const img = element('img', 'card-img-top');
+        img.src = record.image;
+        if (record.srcset) {
+            img.srcset = record.srcset;
+            img.sizes = sizes;
+        }
+        img.loading = 'lazy';
+        img.alt = record.title;
+        link.appendChild(img);
+        
+        const body = element('div', 'card-body');
+        body.appendChild(element('h4', 'h6 mb-2', record.title));
+        body.appendChild(element('p', 'mb-1', record.artist.join(', ')));
+        body.appendChild(element('p', 'text-muted mb-0', record.format || ''));
+        if (record.scrobbles) {
+            body.appendChild(element('p', 'scrobble-count mb-0 lastfm-text', `${record.scrobbles} scrobbles`));
+        }
+        link.appendChild(body);
+        card.appendChild(link);
+        col.appendChild(card);
+        return col;
+    }
+    
+    function loadMonth(section) {
+        if (section.dataset.loading) {
+            return Promise.resolve(false);
+        }
+        section.dataset.loading = 'true';
+        return fetch(section.dataset.monthShard)
+            .then(response => {
+                if (!response.ok) {
+                    throw new Error(`HTTP ${response.status}`);
+                }
+                return response.json();
+            })
+            .then(records => {
+                const grid = section.querySelector('.month-records');
+                const fragment = document.createDocumentFragment();
+                records.forEach(record => fragment.appendChild(recordCard(record, section.dataset.imageSizes)));
+                grid.appendChild(fragment);
+                section.style.minHeight = '';
+                return true;
+            })
+            .catch(error => {
+                console.error(`Could not load ${section.dataset.monthShard}:`, error);
+                delete section.dataset.loading;
+                return false;
+            });
+    }
+    
+    if (!('IntersectionObserver' in window)) {
+        sections.forEach(loadMonth);
+        return;
+    }
+    
+    // Start fetching a little before a month reaches the viewport
+    const observer = new IntersectionObserver(entries => {
+        entries.forEach(entry => {
+            if (entry.isIntersecting) {
+                // Keep watching until the shard has loaded, so a failed fetch
+                // is retried the next time the month scrolls into view
+                loadMonth(entry.target).then(loaded => {
+                    if (loaded) {
+                        observer.unobserve(entry.target);
+                    }
+                });
+            }
+        });
+    }, { rootMargin: '800px 0px' });
+    sections.forEach(section => observer.observe(section));
+});
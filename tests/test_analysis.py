@@ -0,0 +1,136 @@
+"""The single-pass, multi-process and columnar analyses must match the
+original multi-pass analyze_collection on generated collections."""
+from collections import Counter
+from datetime import datetime
+import pytest
+import generate_report
+import synthetic
+
+YEAR = 2024
+SEEDS = range(10)
+
+def baseline_analyze(data, year):
+    """analyze_collection as it was before the single-pass aggregator"""
+    data = [record for record in data if record['album_uri'] is not None and record['artist_uri'] is not None]
+    sorted_records = sorted(data, key=lambda x: x['date_added'])
+    
+    monthly_adds = Counter()
+    for item in data:
+        monthly_adds[datetime.fromisoformat(item['date_added']).strftime('%B')] += 1
+    
+    genres = Counter()
+    styles = Counter()
+    for item in data:
+        for genre in item['genres']:
+            genres[genre] += 1
+        for style in item.get('styles', []):
+            styles[style] += 1
+    
+    formats = Counter()
+    for item in data:
+        for format_info in item['formats']:
+            formats[f"{format_info['name']} ({', '.join(format_info['descriptions'])})"] += 1
+    
+    labels = Counter()
+    for item in data:
+        for label in item['labels']:
+            labels[label] += 1
+    
+    records_by_month = {}
+    for item in sorted_records:
+        records_by_month.setdefault(datetime.fromisoformat(item['date_added']).strftime('%B'), []).append(item)
+    
+    artist_counts = {}
+    artist_records = {}
+    artist_images = {}
+    for item in data:
+        artists = item.get('artist', [])
+        if isinstance(artists, str):
+            artists = [artists]
+        artist_key = ' & '.join(artists) if len(artists) > 1 else artists[0]
+        if artist_key not in artist_counts:
+            artist_counts[artist_key] = 0
+            artist_records[artist_key] = []
+            artist_images[artist_key] = item.get('artist_image', '')
+        artist_counts[artist_key] += 1
+        artist_records[artist_key].append(item)
+    
+    top_artists = []
+    for artist, count in sorted(artist_counts.items(), key=lambda x: x[1], reverse=True):
+        if artist.lower() != "various":
+            top_artists.append({'name': artist, 'count': count, 'image': artist_images[artist],
+                                'records': artist_records[artist]})
+            if len(top_artists) == 12:
+                break
+    
+    return {
+        'total_records': len(data),
+        'monthly_adds': dict(monthly_adds),
+        'top_genres': dict(genres.most_common(5)),
+        'top_styles': dict(styles.most_common(5)),
+        'top_formats': dict(formats.most_common(5)),
+        'top_labels': dict(labels.most_common(5)),
+        'monthly_data': [monthly_adds[month] for month in generate_report.MONTHS],
+        'records_by_month': records_by_month,
+        'top_artists': top_artists,
+        'recent_additions': sorted(data, key=lambda x: x['date_added'], reverse=True)[:10],
+        'genres': dict(genres),
+        'styles': dict(styles),
+        'formats': dict(formats),
+        'labels': dict(labels),
+        'artists': artist_counts
+    }
+
+def comparable(stats):
+    """Reduce stats to ordered plain data; records become their report cards"""
+    card = generate_report.card_record
+    result = {key: list(value.items()) if isinstance(value, dict) else value
+              for key, value in stats.items() if key not in ('records_by_month', 'top_artists', 'recent_additions')}
+    result['records_by_month'] = [(month, [card(record) for record in records])
+                                  for month, records in stats['records_by_month'].items()]
+    # Artist cards only use the first record
+    result['top_artists'] = [(artist['name'], artist['count'], artist['image'], card(artist['records'][0]))
+                             for artist in stats['top_artists']]
+    result['recent_additions'] = [card(record) for record in stats['recent_additions']]
+    return result
+
+def expected(data):
+    return comparable(baseline_analyze(data, YEAR))
+
+def actual(stats):
+    result = comparable(stats)
+    assert stats['year'] == YEAR
+    assert stats['months'] == generate_report.MONTHS
+    for key in ('year', 'months', 'month_ids'):
+        result.pop(key)
+    return result
+
+@pytest.mark.parametrize('seed', SEEDS)
+def test_single_pass_matches_baseline(seed):
+    data = synthetic.make_collection(1500, YEAR, seed)
+    assert actual(generate_report.analyze_collection(data, YEAR)) == expected(data)
+
+@pytest.mark.parametrize('seed', SEEDS)
+def test_streamed_records_match_baseline(seed):
+    data = synthetic.make_collection(1500, YEAR, seed)
+    assert actual(generate_report.analyze_collection(iter(data), YEAR)) == expected(data)
+
+@pytest.mark.parametrize('seed', SEEDS[:3])
+def test_workers_match_baseline(seed):
+    data = synthetic.make_collection(1500, YEAR, seed)
+    assert actual(generate_report.analyze_collection(data, YEAR, workers=3)) == expected(data)
+
+@pytest.mark.parametrize('seed', SEEDS)
+def test_columnar_matches_baseline(seed):
+    pytest.importorskip('numpy')
+    import collection_columns
+    data = synthetic.make_collection(1500, YEAR, seed)
+    columns = collection_columns.ColumnarCollection(iter(data))
+    assert actual(generate_report.analyze_collection(columns, YEAR)) == expected(data)
+
+def test_merged_chunks_match_single_pass():
+    data = synthetic.make_collection(1500, YEAR, 0)
+    merged = generate_report.CollectionStats()
+    for start in range(0, len(data), 400):
+        merged.merge(generate_report.CollectionStats().update(data[start:start + 400]))
+    assert merged.result(YEAR) == generate_report.analyze_collection(data, YEAR)
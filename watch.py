@@ -0,0 +1,230 @@
+#!/usr/bin/env python3
+"""Keep unwrapped/ current while you work on it.
+
+    python watch.py                      # Watch, sync hourly and serve on http://127.0.0.1:8000
+    python watch.py --lastfm --sync-interval 900
+    python watch.py --no-sync --port 8080
+
+Templates, static files and the local collection and Last.fm files are
+polled for changes. Only the pages they affect are rebuilt, always offline,
+so an edit never waits on Discogs or Last.fm. A background thread syncs
+both on a schedule and rewrites the data files of the years that changed,
+which the watcher then picks up like any other edit.
+"""
+import os
+import re
+import time
+import threading
+import logging
+from datetime import datetime
+from http.server import ThreadingHTTPServer, SimpleHTTPRequestHandler
+import collection_io
+import collection_store
+import generate_wrap
+import metrics
+
+logger = logging.getLogger(__name__)
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+UNWRAPPED_DIR = os.path.join(BASE_DIR, 'unwrapped')
+WATCHED_DIRS = ['templates', 'static']
+LASTFM_FILE_RE = re.compile(r'^lastfm_(\d{4})\.json$')
+# Templates that only feed one page rather than every year report
+PAGE_TEMPLATES = {'index.html', 'alltime.html'}
+POLL_INTERVAL = 0.25  # seconds between scans for changes
+SETTLE_TIME = 0.1  # wait for an editor to finish writing before rebuilding
+DEFAULT_SYNC_INTERVAL = 3600  # seconds between scheduled syncs, unless WATCH_SYNC_INTERVAL is set
+
+def parse_args():
+    sync_interval = int(os.getenv('WATCH_SYNC_INTERVAL', DEFAULT_SYNC_INTERVAL))
+    parser = generate_wrap.build_parser('Rebuild Vinyl Unwrapped as files change and serve a local preview')
+    parser.add_argument('--host', default='127.0.0.1', help='Address the preview server listens on')
+    parser.add_argument('--port', type=int, default=8000, help='Port for the preview server')
+    parser.add_argument('--no-serve', action='store_true', help='Only rebuild, without the preview server')
+    parser.add_argument('--poll', type=float, default=POLL_INTERVAL, help='Seconds between checks for changes')
+    parser.add_argument('--sync-interval', type=int, default=sync_interval,
+                      help=f'Seconds between Discogs/Last.fm syncs (defaults to {sync_interval})')
+    parser.add_argument('--no-sync', action='store_true', help='Never contact Discogs or Last.fm')
+    # Forking a pool while the server and sync threads run is unsafe, and
+    # in-process builds keep compiled templates warm between rebuilds
+    parser.set_defaults(jobs=1)
+    return parser.parse_args()
+
+def data_year(name):
+    """Year of a collection or Last.fm file in the base directory, or None"""
+    match = generate_wrap.COLLECTION_FILE_RE.match(name) or LASTFM_FILE_RE.match(name)
+    return int(match.group(1)) if match else None
+
+def snapshot():
+    """Map every watched file to its (mtime, size)"""
+    paths = [os.path.join(BASE_DIR, name) for name in os.listdir(BASE_DIR) if data_year(name) is not None]
+    for directory in WATCHED_DIRS:
+        for root, _, names in os.walk(os.path.join(BASE_DIR, directory)):
+            paths.extend(os.path.join(root, name) for name in names)
+    files = {}
+    for path in paths:
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:  # editors' temporary files come and go
+            continue
+        files[path] = (stat.st_mtime_ns, stat.st_size)
+    return files
+
+def changed_files(old, new):
+    return sorted(path for path in old.keys() | new.keys() if old.get(path) != new.get(path))
+
+def affected_years(paths, publish=False):
+    """Work out which year reports a set of changed files can affect.
+    
+    Report templates feed every year; the index and all-time templates
+    feed no year page (those pages are checked on every build anyway).
+    Static files are copied on every build and only change the reports
+    when publishing rewrites their fingerprinted names. Data files only
+    affect their own year.
+    """
+    every_year = generate_wrap.discover_years(BASE_DIR)
+    years = set()
+    for path in paths:
+        relative = os.path.relpath(path, BASE_DIR)
+        top = relative.split(os.sep)[0]
+        if top == 'templates' and os.path.basename(path) not in PAGE_TEMPLATES:
+            return every_year
+        if top == 'static' and publish:
+            return every_year
+        year = data_year(relative)
+        if year is not None:
+            years.add(year)
+    return sorted(years)
+
+def rebuild(args, years):
+    """Rebuild offline; the build manifest skips anything still up to date"""
+    metrics.reset()
+    start = time.perf_counter()
+    try:
+        generate_wrap.run(args, years=years)
+    except Exception:
+        # A broken template should not stop the watcher
+        logger.exception("Rebuild failed")
+        return
+    logger.info(f"Rebuilt {', '.join(map(str, years)) if years else 'index pages'} "
+                f"in {time.perf_counter() - start:.2f}s")
+
+def sync_once(args):
+    """Sync Discogs (and Last.fm) and rewrite the data files of changed years"""
+    # Imported here so a --no-sync watcher never loads the HTTP clients
+    import fetch_collection
+    if args.no_store:
+        # Without the store there is no change tracking; refetch the current year
+        years = [datetime.now().year]
+    else:
+        started = datetime.now().isoformat()
+        fetch_collection.sync_store(enrich=args.enrich)
+        conn = collection_store.open_store()
+        try:
+            years = collection_store.years_synced_since(conn, started)
+        finally:
+            conn.close()
+    for year in years:
+        output_file = (collection_io.find_collection_file(BASE_DIR, year)
+                       or collection_io.collection_path(BASE_DIR, year, args.format))
+        fetch_collection.main(year, output_file, use_store=not args.no_store, enrich=args.enrich,
+                              sync=False)
+    
+    if args.lastfm:
+        import fetch_lastfm
+        # Past years are complete; only the current one gains scrobbles
+        year = datetime.now().year
+        fetch_lastfm.main(year, os.path.join(BASE_DIR, f'lastfm_{year}.json'), force=True)
+    logger.info(f"Scheduled sync finished ({len(years)} years changed)")
+
+def sync_loop(args, stop):
+    while not stop.is_set():
+        try:
+            sync_once(args)
+        except Exception:
+            logger.exception("Scheduled sync failed; will retry at the next interval")
+        stop.wait(args.sync_interval)
+
+class PreviewHandler(SimpleHTTPRequestHandler):
+    """Serve unwrapped/ with ETag and Last-Modified revalidation.
+    
+    Pages can change several times within a second while you edit, which
+    Last-Modified cannot express, so the ETag (mtime in nanoseconds and
+    size) takes precedence and browsers are told to revalidate each time.
+    """
+    
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, directory=UNWRAPPED_DIR, **kwargs)
+    
+    def send_head(self):
+        self.etag = None
+        path = self.translate_path(self.path)
+        if os.path.isdir(path):
+            if not self.path.split('?', 1)[0].endswith('/'):
+                return super().send_head()  # redirects to the trailing slash
+            path = os.path.join(path, 'index.html')
+        if os.path.isfile(path):
+            stat = os.stat(path)
+            self.etag = f'"{stat.st_mtime_ns:x}-{stat.st_size:x}"'
+            if self.etag in [tag.strip() for tag in self.headers.get('If-None-Match', '').split(',')]:
+                self.send_response(304)
+                self.end_headers()
+                return None
+        # With If-None-Match present, the base class ignores If-Modified-Since
+        return super().send_head()
+    
+    def end_headers(self):
+        if getattr(self, 'etag', None):
+            self.send_header('ETag', self.etag)
+            self.send_header('Cache-Control', 'no-cache')
+        super().end_headers()
+    
+    def log_message(self, format, *args):
+        logger.debug(f"{self.address_string()} {format % args}")
+
+def serve(host, port):
+    """Start the preview server on a background thread"""
+    server = ThreadingHTTPServer((host, port), PreviewHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    logger.info(f"Serving unwrapped/ at http://{host}:{server.server_port}/")
+    return server
+
+def main():
+    args = parse_args()
+    generate_wrap.setup_logging()
+    # The index pages are written relative to the working directory
+    os.chdir(BASE_DIR)
+    # Builds never fetch; the sync thread keeps the data files current
+    args.offline = True
+    args.force = False
+    
+    rebuild(args, generate_wrap.discover_years(BASE_DIR))
+    state = snapshot()
+    
+    server = None if args.no_serve else serve(args.host, args.port)
+    stop = threading.Event()
+    if not args.no_sync and args.sync_interval > 0:
+        threading.Thread(target=sync_loop, args=(args, stop), daemon=True).start()
+    
+    logger.info(f"Watching {', '.join(WATCHED_DIRS)} and the collection files for changes (Ctrl+C to stop)")
+    try:
+        while True:
+            time.sleep(args.poll)
+            current = snapshot()
+            if current == state:
+                continue
+            time.sleep(SETTLE_TIME)
+            current = snapshot()
+            paths = changed_files(state, current)
+            state = current
+            logger.info(f"Changed: {', '.join(os.path.relpath(path, BASE_DIR) for path in paths)}")
+            rebuild(args, affected_years(paths, args.publish))
+    except KeyboardInterrupt:
+        logger.info("Stopping")
+    finally:
+        stop.set()
+        if server:
+            server.shutdown()
+
+if __name__ == "__main__":
+    main()